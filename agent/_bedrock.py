@@ -0,0 +1,67 @@
+"""Bedrock接続の共有ヘルパー"""
+import functools
+import boto3
+from botocore.config import Config
+from strands.models import BedrockModel
+
+# Bedrock利用時のAWSプロファイル・リージョン
+PROFILE_NAME = 'bedrock_use_only'
+REGION_NAME = 'ap-northeast-1'
+
+# 並列ツール呼び出しに備えて接続プールを広げ、リトライはスロットリングに追従する適応モードにする
+CLIENT_CONFIG = Config(
+    max_pool_connections=32,
+    retries={"mode": "adaptive"},
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_session() -> boto3.Session:
+    """プロセス内で共有するboto3セッションを取得
+
+    認証情報の解決や設定ファイルの読み込みは初回のみ行う。
+
+    Returns:
+        boto3.Session: 共有セッション
+    """
+    return boto3.Session(profile_name=PROFILE_NAME, region_name=REGION_NAME)
+
+
+def _create_bedrock_model(config_items: tuple) -> BedrockModel:
+    """共有セッション・接続設定でBedrockModelを生成
+
+    Args:
+        config_items: ソート済みの (key, value) のタプル
+
+    Returns:
+        BedrockModel: 生成したモデル
+    """
+    config = {
+        "boto_session": get_session(),
+        "boto_client_config": CLIENT_CONFIG,
+    }
+    config.update(config_items)
+    return BedrockModel(**config)
+
+
+_get_cached_bedrock_model = functools.lru_cache(maxsize=16)(_create_bedrock_model)
+
+
+def get_bedrock_model(**config) -> BedrockModel:
+    """設定が同じBedrockModelを共有して取得
+
+    同じ設定のモデルは同じインスタンス（同じHTTPS接続プール）を使い回す。
+
+    Args:
+        **config: BedrockModelの設定（model_id, temperature など）
+
+    Returns:
+        BedrockModel: 共有モデル
+    """
+    config_items = tuple(sorted(config.items()))
+    try:
+        hash(config_items)
+    except TypeError:
+        # 辞書などハッシュ化できない設定値を含む場合は共有しない
+        return _create_bedrock_model(config_items)
+    return _get_cached_bedrock_model(config_items)
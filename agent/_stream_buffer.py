@@ -0,0 +1,25 @@
+"""ストリーミングイベントのバッファリング"""
+from typing import AsyncIterator
+from utils.stream_prefetch import StreamPrefetcher
+
+
+async def buffered(events: AsyncIterator[dict], max_chars: int = 8192, max_ms: float = 25) -> AsyncIterator[dict]:
+    """テキストイベントをまとめて返すストリームラッパー
+
+    元のストリームは StreamPrefetcher の1つのタスクで読み出し、テキストのまとめ方は
+    StreamPrefetcher.events() と同じ（最大 max_chars 文字、または max_ms ミリ秒ごと）。
+
+    Args:
+        events: 元のイベントストリーム
+        max_chars: まとめるテキストの最大文字数
+        max_ms: テキストを溜めておく最大時間（ミリ秒）
+
+    Yields:
+        dict: イベント（まとめたテキストは {"data": str} の形式）
+    """
+    prefetcher = StreamPrefetcher(events)
+    try:
+        async for event in prefetcher.events(max_chars, max_ms):
+            yield event
+    finally:
+        await prefetcher.aclose()
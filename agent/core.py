@@ -1,14 +1,200 @@
 """価格転嫁支援エージェントのコア実装"""
+import asyncio
+import copy
+import functools
+import io
+import logging
+import os
+import re
+import threading
+from typing import AsyncIterator
 from strands import Agent
 from strands.models import BedrockModel
+from strands.tools.executors import ConcurrentExecutor
 from strands_tools import current_time, calculator
 from tools.diagram_generator import generate_diagram
 from tools.web_search import web_search
 from tools.knowledge_base import search_knowledge_base
 from tools.step_detector import detect_current_step
 from tools.cost_analysis import analyze_cost_impact
+from tools.batch_invoke import batch_invoke
+from utils.stream_prefetch import StreamPrefetcher
+from ._bedrock import get_bedrock_model
+from ._stream_buffer import buffered
 from .prompts import MAIN_SYSTEM_PROMPT, get_step_prompt
 
+logger = logging.getLogger(__name__)
+
+# デバッグ出力の有効化フラグ（環境変数 AGENT_DEBUG=1 で有効）
+_DEBUG = os.environ.get("AGENT_DEBUG") == "1"
+
+# システムプロンプトからユーザー情報部分を抽出する正規表現（デバッグ用）
+_USER_INFO_RE = re.compile(r'## ユーザー企業の基本情報.*?(?=\n\n##|$)', re.DOTALL)
+
+# エージェントに登録するツール（全エージェントで共通）
+_TOOLS = (
+    current_time,
+    calculator,
+    web_search,
+    search_knowledge_base,
+    generate_diagram,
+    detect_current_step,
+    analyze_cost_impact,
+    batch_invoke,
+)
+
+# ユーザー情報の項目（キー, プロンプト上の表示名）。この順でプロンプトに並べる
+_USER_FIELDS = (
+    ("industry", "業種"),
+    ("products", "主な製品・サービス"),
+    ("companySize", "従業員規模"),
+    ("region", "地域"),
+    ("clientIndustry", "取引先の主な業種"),
+    ("priceTransferStatus", "現在の価格転嫁の状況"),
+)
+
+# ユーザー情報プロンプトの定型部分
+_USER_INFO_HEADER = "## ユーザー企業の基本情報\n\n"
+_USER_INFO_FOOTER = (
+    "\n\n**重要**: 上記のユーザー企業の情報を踏まえて、より具体的で実践的なアドバイスを提供してください。"
+    "\n- 業種や規模に応じた具体的な事例や手法を提示"
+    "\n- 地域の特性を考慮した情報提供"
+    "\n- 現在の価格転嫁の状況に応じた適切なステップの提案"
+)
+
+# 同期実行（run）用の常駐イベントループ（初回使用時に専用スレッドで起動）
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """同期実行用の常駐イベントループを取得
+
+    呼び出しごとにイベントループを生成・破棄すると、Bedrockへの
+    HTTPS接続（keep-alive）も毎回張り直しになるため、ループを使い回す。
+
+    Returns:
+        asyncio.AbstractEventLoop: バックグラウンドスレッドで稼働中のイベントループ
+    """
+    global _LOOP
+    if _LOOP is None:
+        with _LOOP_LOCK:
+            if _LOOP is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                _LOOP = loop
+    return _LOOP
+
+
+def _blocks_to_text(blocks: list) -> str:
+    """システムプロンプトブロックからテキスト部分のみを結合
+
+    Args:
+        blocks: システムコンテンツブロックのリスト
+
+    Returns:
+        str: 結合されたシステムプロンプト
+    """
+    return "\n\n".join([block["text"] for block in blocks if "text" in block])
+
+
+def _freeze_user_info(user_info: dict) -> tuple:
+    """ユーザー情報をキャッシュキーとして使えるタプルに変換
+
+    Args:
+        user_info: ユーザー基本情報の辞書
+
+    Returns:
+        tuple: キー順にソートした (key, value) のタプル
+    """
+    return tuple(sorted(user_info.items())) if user_info else ()
+
+
+@functools.lru_cache(maxsize=64)
+def _build_user_info_prompt(user_info_items: tuple) -> str:
+    """ユーザー情報からプロンプトを構築
+
+    Args:
+        user_info_items: _freeze_user_info で変換したユーザー情報
+
+    Returns:
+        str: ユーザー情報プロンプト
+    """
+    if not user_info_items:
+        return ""
+
+    user_info = dict(user_info_items)
+    info_parts = [
+        f"- **{label}**: {value}" for key, label in _USER_FIELDS if (value := user_info.get(key))
+    ]
+
+    if not info_parts:
+        logger.debug("ユーザー情報が空のため、プロンプトに追加しません")
+        return ""
+
+    user_info_text = _USER_INFO_HEADER + "\n".join(info_parts) + _USER_INFO_FOOTER
+
+    logger.debug("ユーザー情報プロンプトを生成しました:\n%s", user_info_text)
+    return user_info_text
+
+
+@functools.lru_cache(maxsize=64)
+def _assemble_prompt_blocks(step: str, user_info_items: tuple) -> tuple:
+    """ステップとユーザー情報からシステムプロンプトのブロックを組み立て
+
+    同じ (ステップ, ユーザー情報) の組み合わせでは組み立て済みの結果を再利用する。
+    不変のMAIN_SYSTEM_PROMPTを先頭に置き、その直後にcachePointを挟むことで
+    Bedrockのプロンプトキャッシュを効かせる。ユーザー情報はセッション中不変の
+    ため、その後ろにもcachePointを置き、ステップ別プロンプトは最後に付与する。
+
+    Args:
+        step: 現在のステップID
+        user_info_items: _freeze_user_info で変換したユーザー情報
+
+    Returns:
+        tuple: Bedrock Converse APIのシステムコンテンツブロック
+    """
+    blocks = [{"text": MAIN_SYSTEM_PROMPT}, {"cachePoint": {"type": "default"}}]
+
+    # ユーザー情報がある場合は追加プロンプトを結合
+    # 値のある項目の判定とプロンプト生成は _build_user_info_prompt の1回の走査で行う
+    user_info_prompt = _build_user_info_prompt(user_info_items)
+    if user_info_prompt:
+        blocks.append({"text": user_info_prompt})
+        blocks.append({"cachePoint": {"type": "default"}})
+        logger.debug("ユーザー情報プロンプトをシステムプロンプトに追加しました")
+    else:
+        logger.debug("ユーザー情報がありません。user_info=%s", dict(user_info_items))
+
+    # ステップが特定されている場合は追加プロンプトを結合
+    if step:
+        step_prompt = get_step_prompt(step)
+        if step_prompt:
+            blocks.append({"text": step_prompt})
+            logger.debug("✅ ステップ別プロンプトを追加: %s", step)
+        else:
+            logger.debug("⚠️ ステップ別プロンプトが見つかりません: %s", step)
+    else:
+        logger.debug("⚠️ current_stepがNoneのため、ステップ別プロンプトを追加しません")
+
+    return tuple(blocks)
+
+
+@functools.lru_cache(maxsize=64)
+def _assemble_prompt_text(step: str, user_info_items: tuple) -> str:
+    """システムプロンプトを1つの文字列として組み立て
+
+    ブロックのテキストを1回のjoinで連結し、結果を (ステップ, ユーザー情報) ごとに再利用する。
+
+    Args:
+        step: 現在のステップID
+        user_info_items: _freeze_user_info で変換したユーザー情報
+
+    Returns:
+        str: 結合されたシステムプロンプト
+    """
+    return _blocks_to_text(_assemble_prompt_blocks(step, user_info_items))
+
 
 class PriceTransferAgent:
     """価格転嫁支援エージェント"""
@@ -21,18 +207,13 @@ class PriceTransferAgent:
             current_step: 現在のステップID（オプション）
             user_info: ユーザー基本情報の辞書（オプション）
         """
-        print("=" * 80)
-        print("[DEBUG] ========== PriceTransferAgent 初期化 ==========")
-        print(f"[DEBUG] user_info引数: {user_info}")
-        print(f"[DEBUG] user_infoの型: {type(user_info)}")
-        
+        logger.debug("PriceTransferAgent 初期化: current_step=%s, user_info=%s", current_step, user_info)
+
         self.current_step = current_step
         self.user_info = user_info or {}
-        print(f"[DEBUG] self.user_infoに設定: {self.user_info}")
-        
+
         self.model = self._initialize_model(model_config)
         self.agent = self._initialize_agent()
-        print("=" * 80)
 
     def _initialize_model(self, config: dict = None) -> BedrockModel:
         """Bedrockモデルを初期化
@@ -43,26 +224,27 @@ class PriceTransferAgent:
         Returns:
             BedrockModel: 初期化されたモデル
         """
-        import boto3
-
-        # AWSプロファイルを使用してセッションを作成（リージョンも指定）
-        session = boto3.Session(
-            profile_name='bedrock_use_only',
-            region_name='ap-northeast-1'
-        )
-
         default_config = {
             "model_id": "jp.anthropic.claude-haiku-4-5-20251001-v1:0",
             "temperature": 0.7,
             "max_tokens": 50000,
             "streaming": True,
-            "boto_session": session,
         }
 
         if config:
             default_config.update(config)
 
-        return BedrockModel(**default_config)
+        # boto3セッションと同一設定のモデルはプロセス内で共有する
+        return get_bedrock_model(**default_config)
+
+    def get_system_prompt_blocks(self) -> list:
+        """現在のステップに応じたシステムプロンプトをブロック形式で生成
+
+        Returns:
+            list: Bedrock Converse APIのシステムコンテンツブロックのリスト
+        """
+        # キャッシュしたブロックを他のエージェントと共有しないよう複製して渡す
+        return copy.deepcopy(list(_assemble_prompt_blocks(self.current_step, _freeze_user_info(self.user_info))))
 
     def get_system_prompt(self) -> str:
         """現在のステップに応じたシステムプロンプトを生成
@@ -70,72 +252,35 @@ class PriceTransferAgent:
         Returns:
             str: システムプロンプト
         """
-        prompt = MAIN_SYSTEM_PROMPT
+        return _assemble_prompt_text(self.current_step, _freeze_user_info(self.user_info))
 
-        # ユーザー情報がある場合は追加プロンプトを結合
-        # 空の辞書でないか、実際に値があるかチェック
-        has_user_info = self.user_info and any(
-            self.user_info.get(key) for key in 
-            ["industry", "products", "companySize", "region", "clientIndustry", "priceTransferStatus"]
-        )
-        
-        if has_user_info:
-            print(f"[DEBUG] ユーザー情報を検出: {self.user_info}")
-            user_info_prompt = self._build_user_info_prompt()
-            if user_info_prompt:
-                prompt += "\n\n" + user_info_prompt
-                print("[DEBUG] ユーザー情報プロンプトをシステムプロンプトに追加しました")
+    def _log_system_prompt(self, system_prompt: str):
+        """システムプロンプトの内容をデバッグログに出力
+
+        Args:
+            system_prompt: 結合済みのシステムプロンプト
+        """
+        # ユーザー情報が含まれているか確認
+        match = _USER_INFO_RE.search(system_prompt)
+        if match:
+            logger.debug("✅ システムプロンプトにユーザー情報が含まれています")
+            logger.debug("ユーザー情報部分:\n%s", match.group())
         else:
-            print(f"[DEBUG] ユーザー情報がありません。user_info={self.user_info}")
+            logger.debug("⚠️ システムプロンプトにユーザー情報が含まれていません")
+            logger.debug("現在のuser_info: %s", self.user_info)
 
-        # ステップが特定されている場合は追加プロンプトを結合
+        # ステップ別プロンプトが含まれているか確認
         if self.current_step:
             step_prompt = get_step_prompt(self.current_step)
             if step_prompt:
-                prompt += "\n\n" + step_prompt
-                print(f"[DEBUG] ✅ ステップ別プロンプトを追加: {self.current_step}")
+                logger.debug("✅ ステップ別プロンプトが追加されています: %s", self.current_step)
+                logger.debug("ステップ別プロンプトの先頭100文字: %s...", step_prompt[:100])
             else:
-                print(f"[DEBUG] ⚠️ ステップ別プロンプトが見つかりません: {self.current_step}")
+                logger.debug("⚠️ ステップ別プロンプトが見つかりません: %s", self.current_step)
         else:
-            print("[DEBUG] ⚠️ current_stepがNoneのため、ステップ別プロンプトを追加しません")
-
-        return prompt
+            logger.debug("⚠️ 現在のステップが設定されていません（current_step=None）")
 
-    def _build_user_info_prompt(self) -> str:
-        """ユーザー情報からプロンプトを構築
-
-        Returns:
-            str: ユーザー情報プロンプト
-        """
-        info_parts = []
-        
-        if self.user_info.get("industry"):
-            info_parts.append(f"- **業種**: {self.user_info['industry']}")
-        if self.user_info.get("products"):
-            info_parts.append(f"- **主な製品・サービス**: {self.user_info['products']}")
-        if self.user_info.get("companySize"):
-            info_parts.append(f"- **従業員規模**: {self.user_info['companySize']}")
-        if self.user_info.get("region"):
-            info_parts.append(f"- **地域**: {self.user_info['region']}")
-        if self.user_info.get("clientIndustry"):
-            info_parts.append(f"- **取引先の主な業種**: {self.user_info['clientIndustry']}")
-        if self.user_info.get("priceTransferStatus"):
-            info_parts.append(f"- **現在の価格転嫁の状況**: {self.user_info['priceTransferStatus']}")
-
-        if not info_parts:
-            print("[DEBUG] ユーザー情報が空のため、プロンプトに追加しません")
-            return ""
-
-        user_info_text = "## ユーザー企業の基本情報\n\n"
-        user_info_text += "\n".join(info_parts)
-        user_info_text += "\n\n**重要**: 上記のユーザー企業の情報を踏まえて、より具体的で実践的なアドバイスを提供してください。"
-        user_info_text += "\n- 業種や規模に応じた具体的な事例や手法を提示"
-        user_info_text += "\n- 地域の特性を考慮した情報提供"
-        user_info_text += "\n- 現在の価格転嫁の状況に応じた適切なステップの提案"
-
-        print(f"[DEBUG] ユーザー情報プロンプトを生成しました:")
-        print(f"{user_info_text}")
-        return user_info_text
+        logger.debug("システムプロンプトの長さ: %d 文字", len(system_prompt))
 
     def _initialize_agent(self) -> Agent:
         """Strandsエージェントを初期化
@@ -143,51 +288,26 @@ class PriceTransferAgent:
         Returns:
             Agent: 初期化されたエージェント
         """
-        system_prompt = self.get_system_prompt()
-        
-        # デバッグ: システムプロンプトの一部をログ出力（ユーザー情報が含まれているか確認）
-        if "ユーザー企業の基本情報" in system_prompt:
-            print("[DEBUG] ✅ システムプロンプトにユーザー情報が含まれています")
-            # ユーザー情報部分を抽出して表示
-            import re
-            match = re.search(r'## ユーザー企業の基本情報.*?(?=\n\n##|$)', system_prompt, re.DOTALL)
-            if match:
-                print(f"[DEBUG] ユーザー情報部分:\n{match.group()}")
-        else:
-            print("[DEBUG] ⚠️ システムプロンプトにユーザー情報が含まれていません")
-            print(f"[DEBUG] 現在のuser_info: {self.user_info}")
-        
-        # デバッグ: ステップ別プロンプトが含まれているか確認
-        if self.current_step:
-            step_prompt = get_step_prompt(self.current_step)
-            if step_prompt:
-                print(f"[DEBUG] ✅ ステップ別プロンプトが追加されています: {self.current_step}")
-                print(f"[DEBUG] ステップ別プロンプトの先頭100文字: {step_prompt[:100]}...")
-            else:
-                print(f"[DEBUG] ⚠️ ステップ別プロンプトが見つかりません: {self.current_step}")
-        else:
-            print("[DEBUG] ⚠️ 現在のステップが設定されていません（current_step=None）")
-        
-        # デバッグ: システムプロンプトの長さを確認
-        print(f"[DEBUG] システムプロンプトの長さ: {len(system_prompt)} 文字")
-        
+        system_blocks = self.get_system_prompt_blocks()
+
+        # デバッグ: システムプロンプトの内容を確認（AGENT_DEBUG=1 のときのみ）
+        if _DEBUG:
+            self._log_system_prompt(self.get_system_prompt())
+
         return Agent(
             model=self.model,
-            tools=[
-                current_time,
-                calculator,
-                web_search,
-                search_knowledge_base,
-                generate_diagram,
-                detect_current_step,
-                analyze_cost_impact
-            ],
-            system_prompt=system_prompt,
+            tools=list(_TOOLS),
+            system_prompt=system_blocks,
+            # 1ターン内の独立したツール呼び出しを並列実行
+            tool_executor=ConcurrentExecutor(),
             callback_handler=None
         )
 
     def update_step(self, new_step: str) -> bool:
-        """ステップを更新してエージェントを再初期化
+        """ステップを更新してシステムプロンプトを差し替え
+
+        エージェントは再生成せず、システムプロンプトのみを更新する。
+        ツールや会話履歴はそのまま引き継がれる。
 
         Args:
             new_step: 新しいステップID
@@ -196,26 +316,48 @@ class PriceTransferAgent:
             bool: ステップが変更された場合True、変更なしの場合False
         """
         if self.current_step != new_step:
-            print(f"[DEBUG] ステップ更新: {self.current_step} -> {new_step}")
-            print(f"[DEBUG] ステップ更新時のuser_info: {self.user_info}")
+            logger.debug("ステップ更新: %s -> %s (user_info=%s)", self.current_step, new_step, self.user_info)
             self.current_step = new_step
-            # エージェントを再初期化（新しいプロンプトで）
-            # ユーザー情報はself.user_infoに保持されているので、再初期化時にも含まれる
-            self.agent = self._initialize_agent()
+            # 新しいステップのプロンプトに差し替え
+            # MAIN_SYSTEM_PROMPTのブロックは変わらないため、キャッシュ済みのプレフィックスはそのまま使われる
+            self.agent.system_prompt = self.get_system_prompt_blocks()
             return True
         return False
 
-    async def stream_async(self, prompt: str):
+    def reset(self):
+        """会話履歴とステップをリセット
+
+        エージェント・モデル・ツールは作り直さずにそのまま再利用する。
+        """
+        logger.debug("PriceTransferAgent リセット: user_info=%s", self.user_info)
+        self.current_step = None
+        self.agent.messages.clear()
+        self.agent.system_prompt = self.get_system_prompt_blocks()
+
+    def stream_async(self, prompt: str) -> AsyncIterator[dict]:
         """非同期ストリーミング応答
 
+        バッファリング用のジェネレータをそのまま返し、イベントを中継するだけの層は挟まない。
+
+        Args:
+            prompt: ユーザーからのプロンプト
+
+        Returns:
+            AsyncIterator[dict]: イベントストリーム（テキストは短時間分をまとめて返す）
+        """
+        return buffered(self.agent.stream_async(prompt))
+
+    def prefetch(self, prompt: str, hold_tools: bool = False) -> StreamPrefetcher:
+        """応答の生成を開始し、イベントをバックグラウンドで先読みする
+
         Args:
             prompt: ユーザーからのプロンプト
+            hold_tools: True の場合、ツールを実行する手前で release() まで生成を止める
 
-        Yields:
-            イベントストリーム
+        Returns:
+            StreamPrefetcher: 先読み中のストリーム（events() でテキストをまとめて受け取る）
         """
-        async for event in self.agent.stream_async(prompt):
-            yield event
+        return StreamPrefetcher(self.agent.stream_async(prompt), hold_tools=hold_tools)
 
     def run(self, prompt: str) -> str:
         """同期実行（テスト用）
@@ -226,4 +368,12 @@ class PriceTransferAgent:
         Returns:
             str: エージェントの応答
         """
-        return self.agent.run(prompt)
+        async def collect() -> str:
+            buf = io.StringIO()
+            async for event in self.stream_async(prompt):
+                data = event.get("data")
+                if data:
+                    buf.write(data)
+            return buf.getvalue()
+
+        return asyncio.run_coroutine_threadsafe(collect(), _get_loop()).result()
@@ -117,6 +117,8 @@ MAIN_SYSTEM_PROMPT = """あなたは中小企業向けの価格転嫁支援専
 4. 具体的なデータがある場合は図表生成（generate_diagram）で可視化
 5. 計算が必要な場合は計算機能（calculator）を使用
 6. **コスト高騰の影響分析**: ユーザーがコスト高騰前と現在の数値（売上高、売上原価、販管費など）を提供した場合、または分析を希望した場合、`analyze_cost_impact` ツールを使用して価格転嫁の必要性を分析すること
+7. **ツールの並列呼び出し**: 互いに依存しない複数のツール呼び出し（例: `search_knowledge_base` と `web_search` の同時検索）は、1回の応答でまとめて呼び出すこと（並列実行されます）
+8. **一括実行（batch_invoke）**: 情報収集の段階で `search_knowledge_base`・`web_search` のうち互いに独立した複数を使う場合は、`batch_invoke` で1回にまとめて呼び出すこと（例: `[{"tool_name": "search_knowledge_base", "arguments": {"query": "..."}}, {"tool_name": "web_search", "arguments": {"query": "..."}}]`）。前の結果を見てから次を決める場合や、`analyze_cost_impact` は個別に呼び出すこと
 
 ### 回答の構成例
 ```
@@ -1,17 +1,23 @@
 """FastAPIバックエンドサーバー"""
 import asyncio
-import json
+import collections
+import contextlib
+import logging
 import os
 import re
-import uuid
-from typing import Dict, Optional
+import secrets
+import stat
+import threading
+import time
+import orjson
+from typing import Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import sys
 from pathlib import Path
-from datetime import datetime
 
 # プロジェクトルートをパスに追加
 project_root = Path(__file__).parent.parent
@@ -19,21 +25,89 @@ sys.path.insert(0, str(project_root))
 
 from agent.core import PriceTransferAgent
 from tools.cost_analysis import calculate_cost_impact
-from tools.step_detector import detect_current_step
+from tools.diagram_generator import DIAGRAMS_DIR, find_latest_diagram
+from tools.step_detector import detect_step, is_step_continuation, warmup as warmup_step_detector
+from utils.logging_setup import setup_logging
+from utils.session_store import SessionStore
+from utils.step_batcher import StepDetectionBatcher
+from utils.tag_stripper import TagStripper, strip_tags
 
-app = FastAPI(title="価格転嫁支援AIアシスタント API")
+logger = logging.getLogger(__name__)
+
+# AGENT_DEBUG=1 のときはデバッグログも出力
+_LOG_LEVEL = logging.DEBUG if os.environ.get("AGENT_DEBUG") == "1" else logging.INFO
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了時の処理"""
+    # 複数ワーカーでは各プロセスで __main__ が実行されないため、ログ出力はここでも設定する（設定済みなら何もしない）
+    setup_logging(_LOG_LEVEL)
+    # 最初のリクエストで接続確立の待ち時間が出ないよう、Bedrockへの接続をバックグラウンドで温めておく
+    threading.Thread(target=warmup_step_detector, name="bedrock-warmup", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="価格転嫁支援AIアシスタント API", lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://localhost:3000"],  # Vite/Reactのデフォルトポート
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # フロントエンドが使うメソッド・ヘッダーのみ許可（リクエストごとにヘッダーを反映する処理を省く）
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+    # プリフライトの結果をブラウザに1日キャッシュさせる
+    max_age=86400,
+)
+
+# セッション管理（メモリ上、上限を超えたら最も古いセッションから破棄。一定時間使われないセッションも破棄）
+sessions: SessionStore = SessionStore(
+    maxsize=int(os.environ.get("MAX_SESSIONS", "1000")),
+    ttl=float(os.environ.get("SESSION_TTL_SECONDS", str(6 * 60 * 60))),
 )
 
-# セッション管理（メモリ上）
-sessions: Dict[str, dict] = {}
+# ステップ判定（同じ質問の同時リクエストは1回の判定にまとめる）
+step_detection_batcher = StepDetectionBatcher(detect_step)
+
+# ツール名から日本語ステータスメッセージへのマッピング
+TOOL_STATUS_MESSAGES = {
+    "web_search": "検索中...",
+    "search_knowledge_base": "検索中...",
+    "generate_diagram": "図を生成中...",
+    "calculator": "計算中...",
+    "detect_current_step": "ステップを判定中...",
+    "analyze_cost_impact": "コスト分析中...",
+    "current_time": "時刻を取得中...",
+    "batch_invoke": "情報を収集中...",
+}
+
+# SSEイベントのプロトコルバージョン（2: テキストを差分の delta イベントで送信）
+SSE_PROTOCOL_VERSION = 2
+
+# イベントがない状態がこの秒数続いたら、接続維持用のコメント行を送る
+SSE_KEEPALIVE_INTERVAL = 15
+
+# 接続維持用のSSEコメント行（クライアントには無視される）
+_SSE_KEEPALIVE = b": keepalive\n\n"
+
+# SSE応答のヘッダー（プロキシやブラウザにキャッシュ・バッファリングさせない）
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+# 図ファイルのキャッシュ指定（ファイル名が一意で内容が変わらないため、ブラウザに長期キャッシュさせる）
+DIAGRAM_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# ステップ判定に渡す会話文脈のメッセージ数（直近の件数）
+HISTORY_CONTEXT_SIZE = 5
+
+# セッションに保持する会話履歴の最大件数（古いものから破棄）
+# モデルに渡す会話はエージェント側（Strandsの会話マネージャー）で管理しており、これは表示・記録用
+MAX_HISTORY_MESSAGES = 40
 
 
 class ChatMessage(BaseModel):
@@ -73,39 +147,158 @@ class CostAnalysisResponse(BaseModel):
     message: Optional[str] = None
 
 
-def get_or_create_session(session_id: Optional[str] = None, user_info: Optional[dict] = None) -> str:
-    """セッションを取得または作成"""
-    if session_id and session_id in sessions:
-        # 既存セッションの場合、created_atがなければ設定
-        if "created_at" not in sessions[session_id]:
-            sessions[session_id]["created_at"] = datetime.now().timestamp()
-        return session_id
+def _sse(payload: dict) -> bytes:
+    """SSEのdataフレームを作成
+
+    Args:
+        payload: 送信するイベント
+
+    Returns:
+        bytes: UTF-8エンコード済みのフレーム
+    """
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+# 内容が毎回同じフレームは起動時に一度だけ作成しておく
+_SSE_THINKING = _sse({'type': 'status', 'status': 'thinking', 'message': '思考中...', 'version': SSE_PROTOCOL_VERSION})
+_SSE_STATUS_NONE = _sse({'type': 'status', 'status': 'none', 'message': ''})
+# 既知のツールの使用中ステータス（ツール名ごと）
+_SSE_TOOL_STATUS = {
+    tool_name: _sse({'type': 'status', 'status': 'tool_use', 'tool': tool_name, 'message': message})
+    for tool_name, message in TOOL_STATUS_MESSAGES.items()
+}
+_SSE_COST_MODAL = _sse({'type': 'tool_use', 'tool': 'analyze_cost_impact', 'show_modal': True})
+
+
+def _finish_response(parts: list, stripper: TagStripper) -> str:
+    """送信済みの差分と保留中のテキストから最終応答を確定
+
+    内部タグは差分を作る時点で逐次除去済みのため、応答全文を走査し直さない。
+    保留中のテキスト（閉じられなかったタグ以降）だけを改めて処理する。
+
+    Args:
+        parts: 内部タグを除いて確定したテキストの差分
+        stripper: 応答に使った TagStripper
+
+    Returns:
+        str: 表示・履歴用のテキスト
+    """
+    return ("".join(parts) + strip_tags(stripper.flush())).strip()
+
+
+def _append_message(session: dict, role: str, content: str):
+    """会話履歴にメッセージを追加
+
+    ステップ判定用の会話文脈の行も同時に追加し、毎回履歴を走査して組み立て直さないようにする。
+
+    Args:
+        session: セッション
+        role: "user" または "assistant"
+        content: メッセージ本文
+    """
+    session["messages"].append({"role": role, "content": content})
+    session["history_rev"] += 1
+    if role == "user":
+        session["history_lines"].append(f"ユーザー: {content}\n")
+    elif role == "assistant":
+        session["history_lines"].append(f"アシスタント: {content[:200]}...\n")  # 長い場合は省略
+
+
+def _history_context(session: dict) -> str:
+    """ステップ判定用の会話文脈を取得
+
+    組み立てた文字列は会話履歴のリビジョンとともにキャッシュし、履歴が変わったときだけ作り直す。
+
+    Args:
+        session: セッション
+
+    Returns:
+        str: 直近のメッセージを整形した会話文脈
+    """
+    if session.get("history_cache_rev") != session["history_rev"]:
+        session["history_cache"] = "".join(session["history_lines"])
+        session["history_cache_rev"] = session["history_rev"]
+    return session["history_cache"]
+
+
+def _ensure_agent(session: dict) -> PriceTransferAgent:
+    """セッションのエージェントを取得（未作成の場合はここで作成）
+
+    セッション作成時には作らず、実際にチャットで使うときまで初期化を遅らせる。
+
+    Args:
+        session: セッション
+
+    Returns:
+        PriceTransferAgent: セッションのエージェント
+    """
+    if session["agent"] is None:
+        session["agent"] = PriceTransferAgent(user_info=session["user_info"])
+    return session["agent"]
+
+
+def _log_warmup_error(future: asyncio.Future):
+    """エージェントの事前作成の失敗を記録（待つ側がいなくても例外を取り出しておく）
+
+    Args:
+        future: エージェントの事前作成タスク
+    """
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("エージェントの事前作成に失敗しました（チャット時に作成します）: %s", future.exception())
+
+
+def _get_session_or_404(session_id: str) -> dict:
+    """セッションを取得（存在しない・期限切れの場合は404）
+
+    Args:
+        session_id: セッションID
+
+    Returns:
+        dict: セッション
+    """
+    try:
+        return sessions[session_id]
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Session not found") from None
+
+
+def get_or_create_session(session_id: Optional[str] = None, user_info: Optional[dict] = None) -> tuple[str, dict]:
+    """セッションを取得または作成
+
+    Args:
+        session_id: 既存セッションのID（None または存在しない場合は新規作成）
+        user_info: 新規作成時に設定するユーザー情報
+
+    Returns:
+        tuple[str, dict]: セッションIDとセッション
+    """
+    session = sessions.get(session_id) if session_id else None
+    if session is not None:
+        # 既存セッションの場合、created_atがなければ設定（リロード時の対策）
+        if "created_at" not in session:
+            session["created_at"] = time.time()
+        return session_id, session
     
-    new_session_id = str(uuid.uuid4())[:8]
+    new_session_id = secrets.token_hex(4)
     
-    # ユーザー情報を辞書形式に変換
-    user_info_dict = None
     if user_info:
-        user_info_dict = {
-            "industry": user_info.get("industry"),
-            "products": user_info.get("products"),
-            "companySize": user_info.get("companySize"),
-            "region": user_info.get("region"),
-            "clientIndustry": user_info.get("clientIndustry"),
-            "priceTransferStatus": user_info.get("priceTransferStatus"),
-        }
-        print(f"[DEBUG] エージェント初期化時にユーザー情報を渡します: {user_info_dict}")
+        logger.debug("エージェント初期化時にユーザー情報を渡します: %s", user_info)
     
-    sessions[new_session_id] = {
+    session = {
         "session_id": new_session_id,
-        "messages": [],
-        "agent": PriceTransferAgent(user_info=user_info_dict),
+        "messages": collections.deque(maxlen=MAX_HISTORY_MESSAGES),
+        # ステップ判定用の会話文脈（直近のメッセージを整形済みで保持）
+        "history_lines": collections.deque(maxlen=HISTORY_CONTEXT_SIZE),
+        # 会話履歴のリビジョン（メッセージ追加・クリアのたびに増やす）
+        "history_rev": 0,
+        "agent": None,  # 最初のチャットで作成（_ensure_agent）
         "current_step": None,
-        "user_info": user_info_dict,
-        "created_at": datetime.now().timestamp()  # セッション作成時刻を記録
+        "user_info": user_info,
+        "created_at": time.time()  # セッション作成時刻を記録
     }
-    print(f"[DEBUG] セッション作成: session_id={new_session_id}, user_info={user_info_dict}")
-    return new_session_id
+    sessions[new_session_id] = session
+    logger.debug("セッション作成: session_id=%s, user_info=%s", new_session_id, user_info)
+    return new_session_id, session
 
 
 @app.get("/")
@@ -117,57 +310,48 @@ async def root():
 @app.post("/api/session", response_model=SessionResponse)
 async def create_session(request: SessionRequest = SessionRequest()):
     """新しいセッションを作成"""
-    print("=" * 80)
-    print("[DEBUG] ========== セッション作成APIが呼ばれました ==========")
-    print(f"[DEBUG] リクエスト全体: {request}")
-    print(f"[DEBUG] request.user_info: {request.user_info}")
-    print(f"[DEBUG] request.user_infoの型: {type(request.user_info)}")
+    logger.debug("セッション作成APIが呼ばれました: user_info=%s", request.user_info)
     
-    user_info_dict = None
-    if request.user_info:
-        print(f"[DEBUG] ユーザー情報が存在します")
-        user_info_dict = {
-            "industry": request.user_info.industry,
-            "products": request.user_info.products,
-            "companySize": request.user_info.companySize,
-            "region": request.user_info.region,
-            "clientIndustry": request.user_info.clientIndustry,
-            "priceTransferStatus": request.user_info.priceTransferStatus,
-        }
-        print(f"[DEBUG] ユーザー情報を辞書に変換: {user_info_dict}")
-    else:
-        print("[DEBUG] ユーザー情報がNoneまたは空です")
+    # ユーザー情報を辞書形式に変換（UserInfo のフィールドがそのままキーになる）
+    user_info_dict = request.user_info.model_dump() if request.user_info else None
+    
+    session_id, session = get_or_create_session(user_info=user_info_dict)
+    
+    # 価格転嫁の状況まで入力済みのユーザーはすぐに相談を始める可能性が高いため、
+    # 最初のチャットを待たずにバックグラウンドでエージェントを作成しておく
+    if user_info_dict and user_info_dict.get("priceTransferStatus"):
+        agent_warmup = asyncio.ensure_future(asyncio.to_thread(_ensure_agent, session))
+        agent_warmup.add_done_callback(_log_warmup_error)
+        session["agent_warmup"] = agent_warmup
     
-    session_id = get_or_create_session(user_info=user_info_dict)
-    print(f"[DEBUG] セッション作成完了: session_id={session_id}")
-    print("=" * 80)
     return SessionResponse(session_id=session_id)
 
 
 @app.get("/api/session/{session_id}/messages")
 async def get_messages(session_id: str):
     """セッションのメッセージ履歴を取得"""
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = _get_session_or_404(session_id)
     
     return {
-        "messages": sessions[session_id]["messages"],
-        "current_step": sessions[session_id]["current_step"]
+        "messages": list(session["messages"]),
+        "current_step": session["current_step"]
     }
 
 
 @app.post("/api/session/{session_id}/clear")
 async def clear_session(session_id: str):
     """セッションをクリア"""
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = _get_session_or_404(session_id)
     
-    user_info = sessions[session_id].get("user_info")
-    sessions[session_id]["messages"] = []
-    sessions[session_id]["agent"] = PriceTransferAgent(user_info=user_info)
-    sessions[session_id]["current_step"] = None
+    session["messages"].clear()
+    session["history_lines"].clear()
+    session["history_rev"] += 1
+    # エージェントは作り直さず、会話履歴とステップのみリセット（未作成なら何もしない）
+    if session["agent"] is not None:
+        session["agent"].reset()
+    session["current_step"] = None
     # セッション開始時刻をリセット（図もクリアされる）
-    sessions[session_id]["created_at"] = datetime.now().timestamp()
+    session["created_at"] = time.time()
     
     return {"message": "Session cleared"}
 
@@ -176,16 +360,10 @@ async def clear_session(session_id: str):
 async def chat_endpoint(request: ChatMessage):
     """チャットエンドポイント（ストリーミング対応）"""
     # セッションを取得または作成
-    session_id = get_or_create_session(request.session_id)
-    session = sessions[session_id]
-    
-    # 既存セッションの場合、created_atがなければ設定（リロード時の対策）
-    if "created_at" not in session:
-        session["created_at"] = datetime.now().timestamp()
+    session_id, session = get_or_create_session(request.session_id)
     
     # ユーザーメッセージを履歴に追加
-    user_message = {"role": "user", "content": request.message}
-    session["messages"].append(user_message)
+    _append_message(session, "user", request.message)
     
     # ステップ更新情報を保存（ストリーミング内で実行するため）
     step_update_info = {
@@ -197,123 +375,148 @@ async def chat_endpoint(request: ChatMessage):
     
     async def stream_response():
         """ストリーミング応答を生成"""
-        full_response = ""
+        # 内部タグを除いて確定した応答テキスト（送信した差分）
+        response_parts = []
+        # 内部タグの除去（チャンクごとに差分だけを処理する）
+        stripper = TagStripper()
         has_content = False
         current_tool = None
         is_cancelled = False
         is_thinking = True  # 最初は思考中
         
-        # ツール名から日本語メッセージへのマッピング
-        tool_status_messages = {
-            "web_search": "検索中...",
-            "search_knowledge_base": "検索中...",
-            "generate_diagram": "図を生成中...",
-            "calculator": "計算中...",
-            "detect_current_step": "ステップを判定中...",
-            "analyze_cost_impact": "コスト分析中...",
-            "current_time": "時刻を取得中...",
-        }
-        
-        # 最初に「思考中」を送信
-        yield f"data: {json.dumps({'type': 'status', 'status': 'thinking', 'message': '思考中...'}, ensure_ascii=False)}\n\n"
+        # 最初に「思考中」を送信（プロトコルバージョンも通知）
+        yield _SSE_THINKING
         
         # ============================================================================
         # ステップ判定を最初に実行（質問の最初にステップ判定を行う）
         # ============================================================================
-        print(f"\n{'='*80}")
-        print(f"[DEBUG] ========== 質問の最初にステップ判定を実行 ==========")
-        print(f"[DEBUG] ユーザーの質問: {request.message}")
-        print(f"{'='*80}\n")
+        logger.debug("質問の最初にステップ判定を実行: %s", request.message)
         
-        # 会話履歴から文脈を構築（直近5件のメッセージ）
-        conversation_context = ""
-        recent_messages = session["messages"][-5:]  # 直近5件
-        for msg in recent_messages:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            if role == "user":
-                conversation_context += f"ユーザー: {content}\n"
-            elif role == "assistant":
-                conversation_context += f"アシスタント: {content[:200]}...\n"  # 長い場合は省略
+        # 会話履歴から文脈を構築（直近のメッセージ、整形済み）
+        conversation_context = _history_context(session)
         
         # ステップ判定を実行（非同期で実行してブロックしないようにする）
         step_updated = False  # 初期化
-        try:
-            # 同期関数を非同期で実行
-            import concurrent.futures
-            loop = asyncio.get_event_loop()
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                step_result_json = await loop.run_in_executor(
-                    executor,
-                    detect_current_step,
-                    request.message,
-                    conversation_context
-                )
+        detection = None
+        if session.get("current_step") and is_step_continuation(request.message):
+            # ステップ確定後の短い相づち等は判定を省略し、現在のステップのまま応答する
+            logger.debug("ステップ判定を省略（現在のステップを継続）: %s", session["current_step"])
+        else:
+            # 同時に届いた同じ質問の判定は1回にまとめる
+            detection = asyncio.ensure_future(
+                step_detection_batcher.detect(request.message, conversation_context, session.get("current_step"))
+            )
+
+        # バックグラウンドで作成中のエージェントがあれば、二重に作らないよう完了を待つ
+        agent_warmup = session.get("agent_warmup")
+        if agent_warmup is not None:
+            try:
+                await agent_warmup
+            except Exception:
+                # 失敗は _log_warmup_error で記録済み。エージェントは下で作成する
+                pass
+            finally:
+                # 完了したタスクをセッションに残さない
+                session["agent_warmup"] = None
+
+        # ステップが確定済みの場合は、判定結果を待たずに現在のステップで応答生成を先行開始する
+        # （生成したイベントはバックグラウンドでキューに溜め、ステップが変わらなければそのまま送信する）
+        agent = _ensure_agent(session)
+        prefetcher = None
+        if detection is not None and session.get("current_step"):
+            # 破棄した場合に戻せるよう履歴を複製しておく。ツールは確定するまで実行しない
+            snapshot = list(agent.agent.messages)
+            prefetcher = agent.prefetch(request.message, hold_tools=True)
+
+        if detection is not None:
+            try:
+                try:
+                    step_result_json = await detection
+                except BaseException:
+                    # クライアント切断などで中断された場合は先行生成も止める
+                    if prefetcher is not None:
+                        prefetcher.cancel()
+                    raise
             
-            # JSON結果をパース
-            step_result = json.loads(step_result_json)
-            detected_step = step_result.get("step")
-            confidence = step_result.get("confidence", "不明")
-            reasoning = step_result.get("reasoning", "理由なし")
+                # JSON結果をパース
+                step_result = orjson.loads(step_result_json)
+                detected_step = step_result.get("step")
+                confidence = step_result.get("confidence", "不明")
+                reasoning = step_result.get("reasoning", "理由なし")
             
-            print(f"[DEBUG] ステップ判定結果:")
-            print(f"  - ステップ: {detected_step}")
-            print(f"  - 信頼度: {confidence}")
-            print(f"  - 理由: {reasoning}\n")
+                logger.debug("ステップ判定結果: step=%s, confidence=%s, reasoning=%s", detected_step, confidence, reasoning)
             
-            # ステップが有効で、現在のステップと異なる場合のみ更新
-            if detected_step and detected_step != "UNKNOWN":
-                current_step = session.get("current_step")
-                if current_step != detected_step:
-                    print(f"[DEBUG] ✅ ステップを更新: {current_step} -> {detected_step}")
-                    session["current_step"] = detected_step
-                    # エージェントを新しいステップで再初期化
-                    session["agent"].update_step(detected_step)
-                    print(f"[DEBUG] ✅ エージェント再初期化完了（新しいプロンプトで）\n")
-                    step_updated = True
+                # ステップが有効で、現在のステップと異なる場合のみ更新
+                if detected_step and detected_step != "UNKNOWN":
+                    current_step = session.get("current_step")
+                    if current_step != detected_step:
+                        logger.debug("ステップを更新: %s -> %s", current_step, detected_step)
+                        if prefetcher is not None:
+                            # 先行生成は旧ステップのプロンプトによるものなので破棄し、会話履歴も戻す
+                            await prefetcher.aclose()
+                            agent.agent.messages[:] = snapshot
+                            prefetcher = None
+                            logger.debug("先行生成を破棄しました")
+                        session["current_step"] = detected_step
+                        # エージェントのシステムプロンプトを新しいステップに更新
+                        agent.update_step(detected_step)
+                        step_updated = True
+                    else:
+                        logger.debug("ステップは既に設定済み: %s", detected_step)
                 else:
-                    print(f"[DEBUG] ℹ️ ステップは既に設定済み: {detected_step}\n")
-            else:
-                print(f"[DEBUG] ⚠️ ステップが判定できませんでした（UNKNOWN）\n")
+                    logger.debug("ステップが判定できませんでした（UNKNOWN）")
             
-            # ステップ更新情報を保存
-            step_update_info["step"] = detected_step
-            step_update_info["confidence"] = confidence
-            step_update_info["reasoning"] = reasoning
-            step_update_info["updated"] = step_updated
+                # ステップ更新情報を保存
+                step_update_info["step"] = detected_step
+                step_update_info["confidence"] = confidence
+                step_update_info["reasoning"] = reasoning
+                step_update_info["updated"] = step_updated
             
-        except Exception as e:
-            print(f"[DEBUG] ❌ ステップ判定エラー: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            print(f"[DEBUG] ⚠️ エラーが発生しましたが、処理を続行します\n")
+            except Exception as e:
+                # エラーが発生しても応答生成は続行する
+                logger.exception("ステップ判定エラー: %s", e)
+        
+        if prefetcher is not None and prefetcher.failed:
+            # 先行生成の失敗は判定後の通常実行でやり直す
+            logger.warning("先行生成エラー（判定後に再実行します）")
+            await prefetcher.aclose()
+            agent.agent.messages[:] = snapshot
+            prefetcher = None
         
         # ステップ更新情報があれば、送信
         if step_update_info.get("updated") and step_update_info.get("step"):
-            yield f"data: {json.dumps({'type': 'step_update', 'step': step_update_info['step'], 'confidence': step_update_info['confidence'], 'reasoning': step_update_info['reasoning']}, ensure_ascii=False)}\n\n"
+            yield _sse({'type': 'step_update', 'step': step_update_info['step'], 'confidence': step_update_info['confidence'], 'reasoning': step_update_info['reasoning']})
         
         try:
-            agent = session["agent"]
-            agent_stream = agent.stream_async(request.message)
-            
-            async for event in agent_stream:
+            if prefetcher is None:
+                prefetcher = agent.prefetch(request.message)
+            else:
+                # ステップが変わらず先行生成を使うため、止めていたツールの実行を許可
+                prefetcher.release()
+            # 先行生成していた場合は溜めたイベントから送信
+            # （テキストのまとめと接続維持の待ち時間は、キューを読むこの1か所で扱う）
+            async for event in prefetcher.events(keepalive=SSE_KEEPALIVE_INTERVAL):
                 # クライアント切断をチェック（非同期ジェネレータの中断を検知）
                 try:
-                    if "data" in event:
+                    if event is None:
+                        # ツール実行中などでしばらくイベントがない場合は、コメント行で接続を維持
+                        yield _SSE_KEEPALIVE
+                    
+                    elif "data" in event:
                         # テキストチャンクが来たら思考中を解除
                         if is_thinking:
                             is_thinking = False
-                            yield f"data: {json.dumps({'type': 'status', 'status': 'none', 'message': ''}, ensure_ascii=False)}\n\n"
+                            yield _SSE_STATUS_NONE
                         
+                        # [IMAGE_PATH:...] などの内部タグを除き、新しく確定したテキストだけを送信
+                        visible = stripper.feed(event["data"])
                         if not has_content:
+                            # 応答先頭の空白は送らない
+                            visible = visible.lstrip()
+                        if visible:
                             has_content = True
-                        
-                        full_response += event["data"]
-                        
-                        # [IMAGE_PATH:...] を除いたテキストを送信
-                        display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
-                        
-                        yield f"data: {json.dumps({'type': 'content', 'data': display_response}, ensure_ascii=False)}\n\n"
+                            response_parts.append(visible)
+                            yield _sse({'type': 'delta', 'data': visible})
                     
                     elif "current_tool_use" in event and event["current_tool_use"].get("name"):
                         # ツール使用情報
@@ -321,128 +524,111 @@ async def chat_endpoint(request: ChatMessage):
                         if tool_name != current_tool:
                             current_tool = tool_name
                             is_thinking = False  # ツール使用中は思考中ではない
-                            print(f"[DEBUG] ツール使用中: {tool_name}")
+                            logger.debug("ツール使用中: %s", tool_name)
                             
-                            # ツール使用中のステータスメッセージを送信
-                            status_message = tool_status_messages.get(tool_name, f"{tool_name}を実行中...")
-                            yield f"data: {json.dumps({'type': 'status', 'status': 'tool_use', 'tool': tool_name, 'message': status_message}, ensure_ascii=False)}\n\n"
+                            # ツール使用中のステータスメッセージを送信（既知のツールは作成済みのフレームを使う）
+                            status_frame = _SSE_TOOL_STATUS.get(tool_name)
+                            if status_frame is None:
+                                status_frame = _sse({'type': 'status', 'status': 'tool_use', 'tool': tool_name, 'message': f"{tool_name}を実行中..."})
+                            yield status_frame
                             
                             # analyze_cost_impactツールの場合は、フロントエンドにモーダル表示イベントを送信
                             if tool_name == "analyze_cost_impact":
-                                yield f"data: {json.dumps({'type': 'tool_use', 'tool': tool_name, 'show_modal': True}, ensure_ascii=False)}\n\n"
+                                yield _SSE_COST_MODAL
                     
                     elif "tool_result" in event:
-                        # ツール結果が来たら、ステータスをクリアして思考中に戻す
+                        # ツール結果が来たら、次のテキストでステータスをクリアする
+                        # （ツールのステータス表示はそのまま残し、思考中は送り直さない）
                         if current_tool:
                             current_tool = None
                             is_thinking = True
-                            yield f"data: {json.dumps({'type': 'status', 'status': 'thinking', 'message': '思考中...'}, ensure_ascii=False)}\n\n"
                         
                         # ツール結果を検知（detect_current_stepは既に質問の最初で実行済み）
                         tool_use = event.get("tool_use", {})
                         if tool_use.get("name") == "detect_current_step":
                             # 既に質問の最初でステップ判定を行っているため、ここではログのみ
                             tool_result = event.get("tool_result", "")
-                            print(f"[DEBUG] ℹ️ エージェントがdetect_current_stepを再度呼び出しました（既に実行済み）")
+                            logger.debug("エージェントがdetect_current_stepを再度呼び出しました（既に実行済み）")
                             # ステップ更新イベントは送信しない（既に質問の最初で処理済み）
                 except (GeneratorExit, asyncio.CancelledError) as e:
                     # クライアント切断を検知
                     is_cancelled = True
-                    print(f"[DEBUG] クライアントが切断されました: {str(e)}")
+                    logger.debug("クライアントが切断されました: %s", e)
                     break
                 except Exception as e:
                     # その他のエラーはログに記録して続行
-                    print(f"[DEBUG] ストリーミング中のエラー: {str(e)}")
+                    logger.warning("ストリーミング中のエラー: %s", e)
                     continue
             
             # クライアントが切断されていない場合のみ最終処理
             if not is_cancelled:
                 # ステータスをクリア
-                yield f"data: {json.dumps({'type': 'status', 'status': 'none', 'message': ''}, ensure_ascii=False)}\n\n"
+                yield _SSE_STATUS_NONE
                 
-                # 最終応答を処理
-                display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
-                display_response = re.sub(r'\[DIAGRAM_IMAGE\].+?\[/DIAGRAM_IMAGE\]', '', display_response).strip()
+                # 最終応答を確定（送信済みの差分に保留分を加える）
+                display_response = _finish_response(response_parts, stripper)
                 
                 # アシスタントメッセージを履歴に追加（空でない場合のみ）
                 if display_response:
-                    session["messages"].append({"role": "assistant", "content": display_response})
+                    _append_message(session, "assistant", display_response)
                 
                 # 完了イベント
-                yield f"data: {json.dumps({'type': 'done', 'content': display_response}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'done', 'content': display_response})
             else:
                 # 停止された場合、部分的な応答を履歴に追加（空でない場合のみ）
-                if full_response:
-                    display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
-                    display_response = re.sub(r'\[DIAGRAM_IMAGE\].+?\[/DIAGRAM_IMAGE\]', '', display_response).strip()
-                    if display_response:
-                        session["messages"].append({"role": "assistant", "content": display_response})
+                display_response = _finish_response(response_parts, stripper)
+                if display_response:
+                    _append_message(session, "assistant", display_response)
             
         except (GeneratorExit, asyncio.CancelledError) as e:
             # クライアント切断を検知
-            print(f"[DEBUG] ストリーミングがキャンセルされました: {str(e)}")
+            logger.debug("ストリーミングがキャンセルされました: %s", e)
             # 部分的な応答を履歴に追加（空でない場合のみ）
-            if full_response:
-                display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
-                display_response = re.sub(r'\[DIAGRAM_IMAGE\].+?\[/DIAGRAM_IMAGE\]', '', display_response).strip()
-                if display_response:
-                    session["messages"].append({"role": "assistant", "content": display_response})
+            display_response = _finish_response(response_parts, stripper)
+            if display_response:
+                _append_message(session, "assistant", display_response)
         except Exception as e:
             error_msg = f"エラーが発生しました: {str(e)}"
-            print(f"[DEBUG] ストリーミングエラー: {error_msg}")
+            logger.error("ストリーミングエラー: %s", error_msg)
             try:
-                yield f"data: {json.dumps({'type': 'error', 'error': error_msg}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'error', 'error': error_msg})
             except:
                 # クライアントが既に切断されている場合は無視
                 pass
-    
+        finally:
+            # 途中で終了した場合に、バックグラウンドの生成が残らないようにする
+            if prefetcher is not None:
+                prefetcher.cancel()
+
     return StreamingResponse(
         stream_response(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers=_SSE_HEADERS
     )
 
 
 @app.get("/api/diagrams/latest")
 async def get_latest_diagram(session_id: Optional[str] = None):
     """最新の図の情報を取得（セッションに紐づく）"""
-    diagrams_dir = os.path.join(os.getcwd(), "diagrams")
-    if not os.path.exists(diagrams_dir):
-        return {"diagram": None}
-    
     # セッションIDが必須（セッションIDがない場合は図を返さない）
-    if not session_id or session_id not in sessions:
+    if not session_id:
+        return {"diagram": None}
+    session = sessions.get(session_id)
+    if session is None:
         return {"diagram": None}
     
     # セッション開始時刻を取得
-    session_start_time = sessions[session_id].get("created_at")
+    session_start_time = session.get("created_at")
     
     # created_atが設定されていない場合は、現在時刻を設定（既存セッション対策）
     if not session_start_time:
-        session_start_time = datetime.now().timestamp()
-        sessions[session_id]["created_at"] = session_start_time
+        session_start_time = time.time()
+        session["created_at"] = session_start_time
     
-    # すべての図ファイルを取得
-    all_diagram_files = [
-        f for f in os.listdir(diagrams_dir) if f.endswith('.png')
-    ]
-    
-    # セッション開始時刻以降に作成された図のみをフィルタリング
-    filtered_files = []
-    for filename in all_diagram_files:
-        filepath = os.path.join(diagrams_dir, filename)
-        file_mtime = os.path.getmtime(filepath)
-        if file_mtime >= session_start_time:
-            filtered_files.append((filename, file_mtime))
-    
-    if filtered_files:
-        # 最新の図を取得
-        filtered_files.sort(key=lambda x: x[1], reverse=True)
-        filename = filtered_files[0][0]
+    # セッション開始時刻以降に保存された最新の図を取得
+    # （ディレクトリが更新されていれば走査が入るため、イベントループを止めないようスレッドプールで実行）
+    filename = await run_in_threadpool(find_latest_diagram, session_start_time)
+    if filename:
         return {
             "diagram": {
                 "filename": filename,
@@ -456,21 +642,37 @@ async def get_latest_diagram(session_id: Optional[str] = None):
 @app.get("/api/diagrams/{filename}")
 async def get_diagram(filename: str):
     """図ファイルを取得"""
-    diagrams_dir = os.path.join(os.getcwd(), "diagrams")
-    filepath = os.path.join(diagrams_dir, filename)
+    if not filename.endswith('.png'):
+        raise HTTPException(status_code=404, detail="Diagram not found")
     
-    if not os.path.exists(filepath) or not filename.endswith('.png'):
+    filepath = os.path.join(DIAGRAMS_DIR, filename)
+    
+    # 存在確認の stat 結果をそのまま FileResponse に渡し、二重に stat しない
+    # （ファイル本体の読み出しと同様に、ディスクアクセスはスレッドプールで行いイベントループを止めない）
+    # ファイル名がディレクトリを指す場合や、途中にディレクトリでない要素を含む場合も404とする
+    try:
+        stat_result = await run_in_threadpool(os.stat, filepath)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    if not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="Diagram not found")
     
-    return FileResponse(filepath, media_type="image/png")
+    # 図のファイル名には毎回ランダムな文字列が入り、同じ名前で内容が変わることはないため長期キャッシュさせる
+    return FileResponse(
+        filepath,
+        media_type="image/png",
+        stat_result=stat_result,
+        headers={"Cache-Control": DIAGRAM_CACHE_CONTROL},
+    )
 
 
 @app.post("/api/cost-analysis", response_model=CostAnalysisResponse)
-async def cost_analysis_endpoint(request: CostAnalysisRequest):
+def cost_analysis_endpoint(request: CostAnalysisRequest):
     """価格転嫁検討ツール - コスト高騰影響分析
     
     このエンドポイントはSTEP_0_CHECK_9（価格転嫁の必要性判定）で使用します。
     価格転嫁の必要性を判定するためのツールで、営業利益が赤字になっているかを調査します。
+    同期関数として定義し、FastAPIのスレッドプールで実行させる（ストリーミング中のイベントループを止めない）。
     """
     try:
         # セッションのcurrent_stepをチェック（オプション）
@@ -493,9 +695,7 @@ async def cost_analysis_endpoint(request: CostAnalysisRequest):
         )
         
     except Exception as e:
-        print(f"[DEBUG] コスト分析エラー: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("コスト分析エラー: %s", e)
         return CostAnalysisResponse(
             success=False,
             result=None,
@@ -511,9 +711,23 @@ if __name__ == "__main__":
     sys.stdout.reconfigure(line_buffering=True)
     sys.stderr.reconfigure(line_buffering=True)
 
-    print("=" * 80, flush=True)
-    print("[DEBUG] FastAPIサーバーを起動します", flush=True)
-    print("[DEBUG] ポート: 8765", flush=True)
-    print("=" * 80, flush=True)
-    uvicorn.run(app, host="0.0.0.0", port=8765)
+    # ログの書き込みはバックグラウンドスレッドで行う
+    setup_logging(_LOG_LEVEL)
+
+    # ワーカープロセス数（セッションはプロセスごとのメモリ上にあるため、
+    # 複数にする場合は同じセッションが同じワーカーに届くようにすること）
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+    logger.info("FastAPIサーバーを起動します（ポート: 8765、ワーカー数: %d）", workers)
+    # HTTPパーサーは uvicorn[standard] の httptools を使用
+    # （uvloop は Windows では入らないため、イベントループは利用可能なら uvloop を選ぶ auto のまま）
+    # 複数ワーカーでは各プロセスがアプリを読み込み直すため、インポート文字列で渡す
+    uvicorn.run(
+        "api.main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8765,
+        loop="auto",
+        http="httptools",
+        workers=workers,
+    )
 
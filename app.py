@@ -4,18 +4,51 @@ import nest_asyncio
 import streamlit as st
 import os
 import re
-import uuid
+import time
+import secrets
 import json
+import logging
+from typing import Optional
 from agent.core import PriceTransferAgent
+from tools.diagram_generator import DIAGRAMS_DIR
+from utils.tag_stripper import TagStripper, strip_diagram_blocks
+
+logger = logging.getLogger(__name__)
 
 # イベントループのネスト許可
 nest_asyncio.apply()
 
+# ストリーミング中に応答表示を更新する最短間隔（秒）
+RENDER_INTERVAL = 0.05
+
+# 応答から除去する内部タグ（開始文字列が含まれない場合は正規表現を使わない）
+_IMAGE_PATH_OPEN = "[IMAGE_PATH:"
+_IMAGE_PATH_RE = re.compile(r'\[IMAGE_PATH:[^\]]*\]')
+# 履歴表示用：画像パスの抽出
+_IMAGE_PATH_CAPTURE_RE = re.compile(r'\[IMAGE_PATH:(.+?)\]')
+
+# 初回アクセス時に表示するウェルカムメッセージ
+WELCOME_MESSAGE = """こんにちは！価格転嫁支援AIアシスタントです。
+
+私は中小企業の皆様の価格転嫁をサポートするために設計されました。
+
+**できること:**
+- 価格転嫁プロセス（準備編・実践編）の各ステップについてアドバイス
+- 原価計算や見積書作成などの具体的な手順の説明
+- 業界動向や事例の検索
+- データの可視化（グラフ作成）
+
+**使い方:**
+お困りのことや知りたいことを、お気軽にご質問ください。
+例: 「原価計算のやり方を教えて」「見積書の作り方は？」「業界の価格転嫁動向を知りたい」
+
+どのようなことでお手伝いできますか？"""
+
 # ============================================================================
 # セッション管理
 # ============================================================================
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())[:8]
+    st.session_state.session_id = secrets.token_hex(4)
 
 SESSION_ID = st.session_state.session_id
 
@@ -52,25 +85,9 @@ st.markdown("---")
 if "messages" not in st.session_state:
     st.session_state.messages = []
     # 初回アクセス時にウェルカムメッセージを追加
-    welcome_message = """こんにちは！価格転嫁支援AIアシスタントです。
-
-私は中小企業の皆様の価格転嫁をサポートするために設計されました。
-
-**できること:**
-- 価格転嫁プロセス（準備編・実践編）の各ステップについてアドバイス
-- 原価計算や見積書作成などの具体的な手順の説明
-- 業界動向や事例の検索
-- データの可視化（グラフ作成）
-
-**使い方:**
-お困りのことや知りたいことを、お気軽にご質問ください。
-例: 「原価計算のやり方を教えて」「見積書の作り方は？」「業界の価格転嫁動向を知りたい」
-
-どのようなことでお手伝いできますか？"""
-
     st.session_state.messages.append({
         "role": "assistant",
-        "content": welcome_message
+        "content": WELCOME_MESSAGE
     })
 
 if "agent" not in st.session_state:
@@ -82,22 +99,71 @@ if "current_step" not in st.session_state:
 # ============================================================================
 # チャット履歴の表示
 # ============================================================================
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
+def parse_message(message: dict) -> tuple:
+    """メッセージを表示用テキストと画像パスに分解（結果はメッセージに保持）
+
+    Streamlitは操作のたびにスクリプト全体を再実行するため、
+    解析済みの結果を再利用して履歴全体の正規表現処理を繰り返さない。
+
+    Args:
+        message: チャット履歴のメッセージ
+
+    Returns:
+        tuple: (画像パスを除いた表示用テキスト, 画像パスのリスト)
+    """
+    parsed = message.get("_parsed")
+    if parsed is None:
         content = message["content"]
+        if _IMAGE_PATH_OPEN not in content:
+            parsed = (content.strip(), [])
+        else:
+            # 1回の分割でテキストと画像パスを取り出す（偶数番目がテキスト、奇数番目が画像パス）
+            pieces = _IMAGE_PATH_CAPTURE_RE.split(content)
+            parsed = ("".join(pieces[::2]).strip(), pieces[1::2])
+        message["_parsed"] = parsed
+    return parsed
+
 
-        # 画像パスを抽出して表示
-        image_paths = re.findall(r'\[IMAGE_PATH:(.+?)\]', content)
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _read_image(path: str, mtime: float) -> bytes:
+    """画像ファイルを読み込む（パスと更新時刻ごとにキャッシュ。再実行をまたいで保持される）"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def load_image(path: str) -> Optional[bytes]:
+    """履歴表示用に画像を取得
+
+    Streamlitは操作のたびに履歴全体を再描画するため、
+    同じ画像を毎回ディスクから読み直さないようにする。
+    更新時刻をキーに含めるので、ファイルが書き換えられた場合は読み直す。
+
+    Args:
+        path: 画像ファイルのパス
+
+    Returns:
+        Optional[bytes]: 画像データ（ファイルがない場合は None）
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    return _read_image(path, mtime)
+
+
+for message in st.session_state.messages:
+    with st.chat_message(message["role"]):
+        display_text, image_paths = parse_message(message)
 
         # 画像パスを除いたテキストを表示
-        display_text = re.sub(r'\[IMAGE_PATH:.+?\]', '', content).strip()
         if display_text:
             st.markdown(display_text)
 
         # 画像があればここに表示
         for image_path in image_paths:
-            if os.path.exists(image_path):
-                st.image(image_path)
+            image = load_image(image_path)
+            if image is not None:
+                st.image(image)
 
 # ============================================================================
 # ユーザー入力
@@ -117,9 +183,12 @@ if prompt := st.chat_input("メッセージを入力してください"):
 
         # ストリーミング処理
         async def stream_response():
-            full_response = ""
+            response_chunks = []  # 応答テキストの断片（表示時にまとめて結合）
+            display_chunks = []  # 内部タグを除いた表示用の断片（チャンクごとに差分だけを処理）
+            stripper = TagStripper()
             has_content = False
             current_tool = None  # 現在使用中のツールを追跡
+            last_render = 0.0  # 最後にストリーミング表示を更新した時刻
             try:
                 agent_stream = st.session_state.agent.stream_async(prompt)
                 async for event in agent_stream:
@@ -128,11 +197,21 @@ if prompt := st.chat_input("メッセージを入力してください"):
                         if not has_content:
                             has_content = True
                         # 生成されたテキストチャンクを追加
-                        full_response += event["data"]
-
-                        # ストリーミング表示用：[IMAGE_PATH:...] を除いたテキストを表示
-                        display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
-                        response_placeholder.markdown(display_response + "▌")
+                        response_chunks.append(event["data"])
+                        # ストリーミング表示用：[IMAGE_PATH:...] などの内部タグを除いた差分を追加
+                        # （前後の空白は最終表示でまとめて除くため、ここでは表示先頭の空白だけ落とす）
+                        visible = stripper.feed(event["data"])
+                        if not display_chunks:
+                            visible = visible.lstrip()
+                        if visible:
+                            display_chunks.append(visible)
+
+                        # Markdownの再描画は一定間隔ごとにまとめて行う
+                        now = time.monotonic()
+                        if now - last_render >= RENDER_INTERVAL:
+                            last_render = now
+                            display_response = "".join(display_chunks)
+                            response_placeholder.markdown(display_response + "▌")
                     elif "current_tool_use" in event and event["current_tool_use"].get("name"):
                         # ツール使用情報の表示（同じツールの場合は1回だけ）
                         tool_name = event["current_tool_use"]["name"]
@@ -141,51 +220,49 @@ if prompt := st.chat_input("メッセージを入力してください"):
                             tool_msg = f"\n\n*[{tool_name} を使用中]*\n\n"
                             if not has_content:
                                 has_content = True
-                            full_response += tool_msg
-                            display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
+                            response_chunks.append(tool_msg)
+                            visible = stripper.feed(tool_msg)
+                            display_chunks.append(visible if display_chunks else visible.lstrip())
+                            display_response = "".join(display_chunks)
                             response_placeholder.markdown(display_response + "▌")
                     elif "tool_result" in event:
                         # ツール結果を検知してステップ判定を処理
                         tool_use = event.get("tool_use", {})
                         if tool_use.get("name") == "detect_current_step":
                             tool_result = event.get("tool_result", "")
-                            print("\n" + "="*80)
-                            print("🎯 [UI] detect_current_step ツール結果を検知")
-                            print(f"📦 ツール結果: {tool_result}")
-                            print("="*80 + "\n")
+                            logger.debug("detect_current_step ツール結果を検知: %s", tool_result)
 
                             try:
                                 # JSON形式の結果をパース
-                                print("🔧 [UI] JSONパース中...")
                                 result_data = json.loads(tool_result)
                                 detected_step = result_data.get("step")
                                 confidence = result_data.get("confidence", "不明")
                                 reasoning = result_data.get("reasoning", "理由なし")
 
-                                print(f"📊 判定結果:")
-                                print(f"   - ステップ: {detected_step}")
-                                print(f"   - 信頼度: {confidence}")
-                                print(f"   - 理由: {reasoning}\n")
+                                logger.debug("判定結果: ステップ=%s, 信頼度=%s, 理由=%s", detected_step, confidence, reasoning)
 
                                 # ステップが有効な場合のみ更新
                                 if detected_step and detected_step != "UNKNOWN":
-                                    print(f"✅ [UI] ステップを更新: {detected_step}")
+                                    logger.debug("ステップを更新: %s", detected_step)
                                     st.session_state.current_step = detected_step
-                                    # エージェントを再初期化
+                                    # エージェントのシステムプロンプトを更新
                                     update_result = st.session_state.agent.update_step(detected_step)
                                     if update_result:
-                                        print(f"✅ [UI] エージェント再初期化完了\n")
+                                        logger.debug("システムプロンプト更新完了")
                                     else:
-                                        print(f"⚠️  [UI] エージェントは既に同じステップです\n")
+                                        logger.debug("エージェントは既に同じステップです")
                                 else:
-                                    print(f"⚠️  [UI] ステップはUNKNOWN - 更新しません\n")
+                                    logger.debug("ステップはUNKNOWN - 更新しません")
                             except (json.JSONDecodeError, AttributeError) as e:
                                 # JSONパースエラーは無視
-                                print(f"❌ [UI] JSONパースエラー: {str(e)}\n")
-                                pass
-
-                # 最終表示（[IMAGE_PATH:...] を除いたテキストを表示）
-                display_response = re.sub(r'\[IMAGE_PATH:[^\]]*\]', '', full_response).strip()
+                                logger.warning("ステップ判定結果のJSONパースエラー: %s", e)
+
+                # 最終表示（[IMAGE_PATH:...] を除いたテキストを表示。逐次除去で取りこぼしたタグも確実に除く）
+                full_response = "".join(response_chunks)
+                display_response = full_response
+                if _IMAGE_PATH_OPEN in display_response:
+                    display_response = _IMAGE_PATH_RE.sub('', display_response)
+                display_response = display_response.strip()
                 response_placeholder.markdown(display_response)
                 return full_response
 
@@ -204,26 +281,29 @@ if prompt := st.chat_input("メッセージを入力してください"):
         full_response = loop.run_until_complete(stream_response())
 
         # 応答テキストから画像タグを除去
-        display_response = re.sub(r'\[DIAGRAM_IMAGE\].+?\[/DIAGRAM_IMAGE\]', '', full_response).strip()
+        display_response = strip_diagram_blocks(full_response).strip()
 
         # アシスタントメッセージを履歴に追加
         st.session_state.messages.append({"role": "assistant", "content": display_response})
 
         # diagrams フォルダから図を取得して表示
-        diagrams_dir = os.path.join(os.getcwd(), "diagrams")
-        if os.path.exists(diagrams_dir):
+        if os.path.exists(DIAGRAMS_DIR):
             # すべての図ファイルを取得（セッションID関係なく最新のものを表示）
-            diagram_files = sorted(
-                [f for f in os.listdir(diagrams_dir) if f.endswith('.png')],
-                key=lambda x: os.path.getmtime(os.path.join(diagrams_dir, x)),
-                reverse=True
-            )
-
-            # 最新の 1 個のファイルのみ表示
+            # scandir はファイル名と属性をまとめて返すため、ファイルごとの stat 呼び出しが不要
+            with os.scandir(DIAGRAMS_DIR) as entries:
+                latest = max(
+                    (
+                        (entry.name, entry.path, entry.stat().st_mtime)
+                        for entry in entries if entry.name.endswith('.png')
+                    ),
+                    key=lambda x: x[2],
+                    default=None
+                )
+
+            # 最新の 1 個のファイルのみ表示（全件の並べ替えはしない）
             recent_diagrams = []
-            if diagram_files:
-                filename = diagram_files[0]
-                filepath = os.path.join(diagrams_dir, filename)
+            if latest:
+                filename, filepath, _ = latest
                 recent_diagrams.append((filename, filepath))
 
             if recent_diagrams:
@@ -13,7 +13,7 @@ interface Message {
 }
 
 interface ChatEvent {
-  type: 'content' | 'tool_use' | 'step_update' | 'done' | 'error' | 'status'
+  type: 'content' | 'delta' | 'tool_use' | 'step_update' | 'done' | 'error' | 'status'
   data?: string
   tool?: string
   show_modal?: boolean
@@ -24,6 +24,7 @@ interface ChatEvent {
   error?: string
   status?: 'thinking' | 'tool_use' | 'none'
   message?: string
+  version?: number
 }
 
 interface UserInfo {
@@ -298,6 +299,8 @@ function App() {
 
       // アシスタントメッセージを追加（最初のcontentイベントで更新される）
       let hasAddedAssistantMessage = false
+      // ストリーミングで受信したテキスト
+      let streamedText = ''
 
       try {
         while (true) {
@@ -312,8 +315,14 @@ function App() {
               try {
                 const event: ChatEvent = JSON.parse(line.slice(6))
 
-                if (event.type === 'content') {
-                  currentResponseRef.current = event.data || ''
+                if (event.type === 'content' || event.type === 'delta') {
+                  // delta: 前回からの差分（プロトコル2）、content: 全文（旧プロトコル）
+                  if (event.type === 'delta') {
+                    streamedText += event.data || ''
+                  } else {
+                    streamedText = event.data || ''
+                  }
+                  currentResponseRef.current = streamedText
                   
                   // 最初のcontentイベントでアシスタントメッセージを追加
                   if (!hasAddedAssistantMessage) {
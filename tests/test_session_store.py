@@ -0,0 +1,59 @@
+"""SessionStore のテスト"""
+import pytest
+
+from utils import session_store
+from utils.session_store import SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.monotonic を手動で進められる時計に置き換える"""
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_returns_none_for_expired_session(clock):
+    store = SessionStore(ttl=10)
+    store["a"] = {"id": "a"}
+    clock[0] += 11
+    assert store.get("a") is None
+    assert "a" not in store
+    assert len(store) == 0
+
+
+def test_get_refreshes_expiry(clock):
+    store = SessionStore(ttl=10)
+    store["a"] = {"id": "a"}
+    clock[0] += 8
+    assert store.get("a") == {"id": "a"}
+    clock[0] += 8
+    assert store["a"] == {"id": "a"}
+
+
+def test_getitem_raises_for_expired_session(clock):
+    store = SessionStore(ttl=10)
+    store["a"] = {"id": "a"}
+    clock[0] += 11
+    with pytest.raises(KeyError):
+        store["a"]
+
+
+def test_len_excludes_expired_sessions(clock):
+    store = SessionStore(ttl=10)
+    store["a"] = {"id": "a"}
+    clock[0] += 5
+    store["b"] = {"id": "b"}
+    clock[0] += 6
+    assert len(store) == 1
+    assert "b" in store
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = SessionStore(maxsize=2)
+    store["a"] = {"id": "a"}
+    store["b"] = {"id": "b"}
+    store.get("a")
+    store["c"] = {"id": "c"}
+    assert "b" not in store
+    assert "a" in store and "c" in store
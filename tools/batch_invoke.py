@@ -0,0 +1,74 @@
+"""複数ツールの一括実行ツール"""
+import asyncio
+from strands import tool
+from tools.web_search import web_search
+from tools.knowledge_base import search_knowledge_base
+
+# batch_invokeから呼び出せるツール（互いに独立して実行でき、結果をテキストで返すだけのもの）
+# analyze_cost_impact はフロントエンドにモーダルとステータスを送るため、個別に呼び出す
+_BATCHABLE_TOOLS = {
+    "web_search": web_search,
+    "search_knowledge_base": search_knowledge_base,
+}
+
+
+def _tool_name(item) -> str:
+    """呼び出し指定からツール名を取得（形式が不正な場合は空文字）"""
+    return str(item.get("tool_name", "")) if isinstance(item, dict) else ""
+
+
+async def _invoke(item) -> str:
+    """登録済みツールを1件実行
+
+    形式の誤りはこの呼び出しだけのエラーとして返し、他の呼び出しは続行させる。
+
+    Args:
+        item: {"tool_name": "ツール名", "arguments": {引数名: 値, ...}} 形式の呼び出し指定
+
+    Returns:
+        str: ツールの実行結果
+    """
+    if not isinstance(item, dict):
+        return "エラー: 呼び出しは {\"tool_name\": ..., \"arguments\": {...}} の形式で指定してください"
+    tool_name = _tool_name(item)
+    target = _BATCHABLE_TOOLS.get(tool_name)
+    if target is None:
+        return f"エラー: batch_invokeで使用できないツールです（{tool_name}）"
+    arguments = item.get("arguments") or {}
+    if not isinstance(arguments, dict):
+        return "エラー: arguments は {引数名: 値} の形式で指定してください"
+    # 各ツールは同期関数のため、スレッドで並列実行する
+    return await asyncio.to_thread(target, **arguments)
+
+
+@tool
+async def batch_invoke(invocations: list) -> str:
+    """互いに独立した複数のツール呼び出しを1回でまとめて並列実行します。
+
+    情報収集の段階で、Knowledge Base検索・Web検索など
+    依存関係のない複数のツールを同時に使いたい場合に使用します。
+    使用できるツール: web_search, search_knowledge_base
+    （analyze_cost_impact は個別に呼び出してください）
+
+    Args:
+        invocations: 実行するツール呼び出しのリスト。各要素は
+            {"tool_name": "ツール名", "arguments": {引数名: 値, ...}} の形式
+            例: [{"tool_name": "search_knowledge_base", "arguments": {"query": "価格交渉 準備"}},
+                 {"tool_name": "web_search", "arguments": {"query": "価格転嫁 最新動向"}}]
+
+    Returns:
+        str: 各ツールの実行結果（呼び出し順）
+    """
+    if not isinstance(invocations, list):
+        return "エラー: invocations は [{\"tool_name\": ..., \"arguments\": {...}}, ...] のリストで指定してください"
+    results = await asyncio.gather(
+        *(_invoke(item) for item in invocations),
+        return_exceptions=True,
+    )
+
+    sections = []
+    for i, (item, result) in enumerate(zip(invocations, results), 1):
+        if isinstance(result, Exception):
+            result = f"エラー: {str(result)}"
+        sections.append(f"=== [{i}] {_tool_name(item)} ===\n{result}")
+    return "\n\n".join(sections)
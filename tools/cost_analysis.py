@@ -2,6 +2,19 @@
 from strands import tool
 
 
+def _percent(numerator: float, denominator: float) -> float:
+    """割合（%）を計算（分母が0以下の場合は0）
+
+    Args:
+        numerator: 分子
+        denominator: 分母
+
+    Returns:
+        float: numerator / denominator * 100
+    """
+    return numerator / denominator * 100 if denominator > 0 else 0
+
+
 def calculate_cost_impact(
     before_sales: float,
     before_cost: float,
@@ -26,19 +39,12 @@ def calculate_cost_impact(
     # コスト高騰前の計算
     before_total_cost = before_cost + before_expenses
     before_profit = before_sales - before_total_cost
-    before_profit_rate = (before_profit / before_sales * 100) if before_sales > 0 else 0
+    before_profit_rate = _percent(before_profit, before_sales)
     
     # 現在の計算
     current_total_cost = current_cost + current_expenses
     current_profit = current_sales - current_total_cost
-    current_profit_rate = (current_profit / current_sales * 100) if current_sales > 0 else 0
-    
-    # 増減率の計算
-    sales_change_rate = ((current_sales - before_sales) / before_sales * 100) if before_sales > 0 else 0
-    cost_change_rate = ((current_cost - before_cost) / before_cost * 100) if before_cost > 0 else 0
-    expenses_change_rate = ((current_expenses - before_expenses) / before_expenses * 100) if before_expenses > 0 else 0
-    total_cost_change_rate = ((current_total_cost - before_total_cost) / before_total_cost * 100) if before_total_cost > 0 else 0
-    profit_change_rate = ((current_profit - before_profit) / before_profit * 100) if before_profit > 0 else 0
+    current_profit_rate = _percent(current_profit, current_sales)
     
     # 増減額の計算
     sales_change = current_sales - before_sales
@@ -47,16 +53,23 @@ def calculate_cost_impact(
     total_cost_change = current_total_cost - before_total_cost
     profit_change = current_profit - before_profit
     
+    # 増減率の計算（増減額 / 変化前の値）
+    sales_change_rate = _percent(sales_change, before_sales)
+    cost_change_rate = _percent(cost_change, before_cost)
+    expenses_change_rate = _percent(expenses_change, before_expenses)
+    total_cost_change_rate = _percent(total_cost_change, before_total_cost)
+    profit_change_rate = _percent(profit_change, before_profit)
+    
     # 参考価格の算出（コスト高騰前の利益率を維持するための価格）
     # 参考価格 = 現在の総コスト / (1 - コスト高騰前の利益率)
     if before_profit_rate < 100:
-        reference_price = current_total_cost / (1 - before_profit_rate / 100) if before_profit_rate < 100 else current_total_cost
+        reference_price = current_total_cost / (1 - before_profit_rate / 100)
     else:
         reference_price = current_total_cost
     
     # 現在価格との差額
     price_gap = reference_price - current_sales
-    price_gap_rate = (price_gap / current_sales * 100) if current_sales > 0 else 0
+    price_gap_rate = _percent(price_gap, current_sales)
     
     return {
         "before": {
@@ -2,9 +2,82 @@
 import subprocess
 import tempfile
 import os
+import re
+import threading
 import uuid
+from typing import Optional
 from strands import tool
 
+# 図の保存先ディレクトリ（起動時の作業ディレクトリ直下。リクエストごとに組み立て直さない）
+DIAGRAMS_DIR = os.path.join(os.getcwd(), "diagrams")
+
+# description からのデータ抽出に使うパターン（JSON形式 / "ラベル: 値" 形式の行）
+_DATA_JSON_RE = re.compile(r'\{.*?"data".*?\}', re.DOTALL)
+_DATA_LINE_RE = re.compile(r'(?:-\s*)?([^:]+):\s*(\d+(?:\.\d+)?)')
+
+# 保存済みの最新の図（ファイル名, 更新時刻）と、それを確認した時点の保存先ディレクトリの更新時刻
+# ディレクトリの更新時刻が変わっていなければ（図が追加されていなければ）走査せずに使い回す
+_latest_diagram = None
+_latest_diagram_dir_mtime = None
+_latest_diagram_lock = threading.Lock()
+
+
+def _scan_latest_diagram(diagrams_dir: str):
+    """保存先ディレクトリを走査して最新の図を取得
+
+    Args:
+        diagrams_dir: 図の保存先ディレクトリ
+
+    Returns:
+        tuple | None: (ファイル名, 更新時刻)。図がない場合は None
+    """
+    # scandir はファイル名と属性をまとめて返すため、ファイルごとの stat 呼び出しが不要
+    with os.scandir(diagrams_dir) as entries:
+        found = [
+            (entry.name, entry.stat().st_mtime)
+            for entry in entries if entry.name.endswith('.png')
+        ]
+    return max(found, key=lambda x: x[1]) if found else None
+
+
+def _record_diagram(path: str):
+    """保存した図を最新の図として記録
+
+    Args:
+        path: 保存した図のパス
+    """
+    global _latest_diagram, _latest_diagram_dir_mtime
+    with _latest_diagram_lock:
+        _latest_diagram = (os.path.basename(path), os.path.getmtime(path))
+        # 自分で保存したことによるディレクトリの更新では走査し直さない
+        _latest_diagram_dir_mtime = os.stat(os.path.dirname(path)).st_mtime_ns
+
+
+def find_latest_diagram(since: float) -> Optional[str]:
+    """指定時刻以降に保存された最新の図を取得
+
+    保存先ディレクトリの更新時刻だけを確認し、変わっていた場合（他のプロセスが図を保存した場合など）のみ走査する。
+
+    Args:
+        since: この時刻（UNIXタイム）以降に保存された図のみを対象にする
+
+    Returns:
+        str | None: 図のファイル名（該当なしの場合は None）
+    """
+    global _latest_diagram, _latest_diagram_dir_mtime
+    try:
+        dir_mtime = os.stat(DIAGRAMS_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _latest_diagram_lock:
+        if dir_mtime != _latest_diagram_dir_mtime:
+            _latest_diagram = _scan_latest_diagram(DIAGRAMS_DIR)
+            _latest_diagram_dir_mtime = dir_mtime
+        latest = _latest_diagram
+    if latest and latest[1] >= since:
+        return latest[0]
+    return None
+
 
 class DiagramGenerator:
     """Python コードを実行して図を生成するユーティリティ"""
@@ -142,10 +215,9 @@ except Exception as e:
 def _extract_data_from_description(description: str):
     """description からデータを抽出"""
     import json
-    import re
 
     # JSON形式を試す
-    json_match = re.search(r'\{.*?"data".*?\}', description, re.DOTALL)
+    json_match = _DATA_JSON_RE.search(description) if '"data"' in description else None
     if json_match:
         try:
             data_dict = json.loads(json_match.group())
@@ -161,7 +233,7 @@ def _extract_data_from_description(description: str):
     lines = description.split('\n')
     for line in lines:
         # リスト形式 "- ラベル: 値" または "ラベル: 値"
-        match = re.search(r'(?:-\s*)?([^:]+):\s*(\d+(?:\.\d+)?)', line)
+        match = _DATA_LINE_RE.search(line) if ':' in line else None
         if match:
             label = match.group(1).strip()
             value = float(match.group(2))
@@ -387,17 +459,17 @@ def generate_diagram(diagram_type: str, title: str, description: str) -> str:
 
         if success:
             # ダウンロード用に diagrams フォルダに保存
-            download_dir = os.path.join(os.getcwd(), "diagrams")
-            os.makedirs(download_dir, exist_ok=True)
+            os.makedirs(DIAGRAMS_DIR, exist_ok=True)
 
             # ファイル名を作成（タイトルをサニタイズ + セッションID）
             safe_title = "".join(c for c in title if c.isalnum() or c in " -_").strip()
             safe_title = safe_title[:50]  # 長さ制限
-            download_path = os.path.join(download_dir, f"{session_id}_{safe_title}_{uuid.uuid4().hex[:8]}.png")
+            download_path = os.path.join(DIAGRAMS_DIR, f"{session_id}_{safe_title}_{uuid.uuid4().hex[:8]}.png")
 
             # ファイルをコピー
             import shutil
             shutil.copy(image_path, download_path)
+            _record_diagram(download_path)
 
             # 成功メッセージを返す
             return f"✅ 図を生成しました: {title}"
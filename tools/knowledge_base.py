@@ -1,9 +1,29 @@
 """Knowledge Base検索ツール（AWS Bedrock Knowledge Base）"""
+import functools
 import json
-import boto3
 import time
 from botocore.exceptions import ClientError
 from strands import tool
+from agent._bedrock import get_session
+
+
+@functools.lru_cache(maxsize=None)
+def _get_agent_runtime_client(region: str):
+    """bedrock-agent-runtimeクライアントを取得
+
+    セッション・クライアントは初回のみ生成し、HTTPS接続プールを使い回す。
+
+    Args:
+        region: AWSリージョン
+
+    Returns:
+        bedrock-agent-runtimeクライアント
+    """
+    # プロセス内で共有するセッション（エージェントのモデルと共通）から生成
+    return get_session().client(
+        service_name='bedrock-agent-runtime',
+        region_name=region
+    )
 
 
 @tool
@@ -22,14 +42,8 @@ def search_knowledge_base(query: str, max_results: int = 5) -> str:
         knowledge_base_id = 'SIILIHIPRU'
         region = 'ap-northeast-1'
 
-        # AWSプロファイルを使用してセッションを作成
-        session = boto3.Session(profile_name='bedrock_use_only')
-
-        # bedrock-agent-runtimeクライアントを使用
-        bedrock_agent_client = session.client(
-            service_name='bedrock-agent-runtime',
-            region_name=region
-        )
+        # bedrock-agent-runtimeクライアントを使用（プロセス内で共有）
+        bedrock_agent_client = _get_agent_runtime_client(region)
 
         # Retrieve API を使用してナレッジベースから関連文書を取得 - リトライロジック付き
         retrieve_params = {
@@ -1,10 +1,367 @@
 """ステップ判定ツール"""
+import functools
 import json
-import boto3
+import logging
+import orjson
 import re
+import threading
 import time
+from typing import Optional
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from strands import tool
+from agent._bedrock import get_session
+
+logger = logging.getLogger(__name__)
+
+# 判定に使用するモデル
+_MODEL_ID = "jp.anthropic.claude-haiku-4-5-20251001-v1:0"
+
+# ステップ判定用のシステムプロンプト（質問によらず不変）
+_SYSTEM_PROMPT = """ユーザーの質問から、最も関連する価格転嫁プロセスのステップを判定してください。
+
+【判定可能なステップ】
+- STEP_0_CHECK_1: 取引条件・業務内容の確認
+- STEP_0_CHECK_2: 原材料費・労務費データの定期収集
+- STEP_0_CHECK_3: 原価計算の実施
+- STEP_0_CHECK_4: 単価表の作成
+- STEP_0_CHECK_5: 見積書フォーマットの整備
+- STEP_0_CHECK_6: 取引先の経営方針・業績把握
+- STEP_0_CHECK_7: 自社の付加価値の明確化
+- STEP_0_CHECK_8: 適正な取引慣行の確認
+- STEP_0_CHECK_9: 価格転嫁の必要性判定
+- STEP_1: 業界動向の情報収集
+- STEP_2: 取引先情報収集と交渉方針検討
+- STEP_3: 書面での申し入れ
+- STEP_4: 説明資料の準備
+- STEP_5: 発注後に発生する価格交渉
+
+【判定ルール】
+1. 質問内容から最も関連するステップを1つ選んでください
+2. 複数のステップに関連する場合は、最も重要なものを選んでください
+3. 明確に判定できない一般的な質問の場合は "UNKNOWN" を返してください
+
+判定結果は record_step ツールで返してください。
+"""
+
+# ユーザーメッセージの定型部分（この後ろに質問を続ける）
+_PROMPT_HEAD = "【ユーザーの質問】\n"
+
+# システムプロンプトのブロック（不変のためcachePointを置き、Bedrockのプロンプトキャッシュを効かせる）
+_SYSTEM_BLOCKS = [{"text": _SYSTEM_PROMPT}, {"cachePoint": {"type": "default"}}]
+
+# 判定可能なステップID
+_STEP_IDS = (
+    "STEP_0_CHECK_1", "STEP_0_CHECK_2", "STEP_0_CHECK_3", "STEP_0_CHECK_4", "STEP_0_CHECK_5",
+    "STEP_0_CHECK_6", "STEP_0_CHECK_7", "STEP_0_CHECK_8", "STEP_0_CHECK_9",
+    "STEP_1", "STEP_2", "STEP_3", "STEP_4", "STEP_5",
+)
+
+# 判定結果を構造化して受け取るためのツール定義（このツールの呼び出しを強制する）
+_TOOL_NAME = "record_step"
+_TOOL_CONFIG = {
+    "tools": [{
+        "toolSpec": {
+            "name": _TOOL_NAME,
+            "description": "ステップの判定結果を記録する",
+            "inputSchema": {"json": {
+                "type": "object",
+                "properties": {
+                    "step": {"type": "string", "enum": [*_STEP_IDS, "UNKNOWN"]},
+                    "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+                    "reasoning": {"type": "string", "description": "判定理由（1文）"},
+                },
+                "required": ["step", "confidence", "reasoning"],
+            }},
+        }
+    }],
+    "toolChoice": {"tool": {"name": _TOOL_NAME}},
+}
+
+# LLMの応答からJSONオブジェクト部分を取り出す正規表現
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Converse APIの固定パラメータ（呼び出しごとに変わるのはmessagesのみ）
+_REQUEST_STANDARD = {
+    "modelId": _MODEL_ID,
+    "system": _SYSTEM_BLOCKS,
+    "inferenceConfig": {
+        "maxTokens": 200,  # 出力はツール引数のみ
+        "temperature": 0,  # 分類タスクなので決定的に
+    },
+    "toolConfig": _TOOL_CONFIG,
+}
+_REQUEST_LATENCY_OPTIMIZED = {**_REQUEST_STANDARD, "performanceConfig": {"latency": "optimized"}}
+
+# 判定結果キャッシュの最大件数
+_CACHE_SIZE = 512
+
+# レイテンシ最適化推論を使用するか（未対応と分かった時点でFalseにする）
+_latency_optimized = True
+
+# LLMを呼ばずにUNKNOWNと判定する挨拶・相づち（前後の空白・句読点は無視）
+_GREETING_RE = re.compile(
+    r'^(こんにちは|こんばんは|おはよう(ございます)?|はじめまして|'
+    r'よろしく(お願いします|お願いいたします)?|ありがとう(ございます)?|'
+    r'hi|hello)?[\s!！。、.?？〜ー]*$',
+    re.IGNORECASE,
+)
+
+# Bedrockクライアントの接続設定（keep-aliveで接続を使い回し、並列リクエストに備えてプールを広げる）
+_CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"max_attempts": 2, "mode": "adaptive"},
+)
+
+# 共有のbedrock-runtimeクライアント（初回使用時に生成）
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """ステップ判定用のbedrock-runtimeクライアントを取得
+
+    セッション作成（設定・認証情報の読み込み）とクライアント生成は初回のみ行う。
+
+    Returns:
+        bedrock-runtimeクライアント
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                logger.debug("Bedrockクライアントを初期化中...")
+                # プロセス内で共有するセッション（エージェントのモデルと共通）から生成
+                _client = get_session().client(
+                    service_name='bedrock-runtime',
+                    region_name='ap-northeast-1',
+                    config=_CLIENT_CONFIG
+                )
+    return _client
+
+
+# ウォームアップ（接続確立）の状態
+_warmup_started = False
+_warmup_done = threading.Event()
+
+
+def warmup():
+    """Bedrockへの接続を事前に確立（ウォームアップ）
+
+    クライアント生成・認証情報の解決・TLS接続を最初のユーザーリクエスト前に済ませるため、
+    最小の出力トークン数で1回だけ判定モデルを呼び出す。失敗しても通常の判定には影響しない。
+    """
+    global _warmup_started
+    _warmup_started = True
+    try:
+        _get_client().converse(
+            modelId=_MODEL_ID,
+            messages=[{"role": "user", "content": [{"text": "test"}]}],
+            inferenceConfig={"maxTokens": 1, "temperature": 0},
+        )
+        logger.info("ステップ判定モデルのウォームアップ完了")
+    except Exception as e:
+        logger.warning("ステップ判定モデルのウォームアップに失敗しました: %s", e)
+    finally:
+        _warmup_done.set()
+
+
+# 「STEP 3」「チェック5」「step0-check2」など、ステップを直接指定した記述（大文字・小文字、全角数字も可）
+_EXPLICIT_STEP_RE = re.compile(
+    r'(?:(?:STEP|ステップ)\s*[0０]\s*[-_－・]?\s*)?(?:CHECK|チェック)\s*([1-9１-９])'
+    r'|(?:STEP|ステップ)\s*([1-5１-５])(?![0-9０-９])',
+    re.IGNORECASE,
+)
+
+
+def _match_explicit_step(user_question: str):
+    """質問中で直接指定されたステップを取得
+
+    Args:
+        user_question: ユーザーの質問内容
+
+    Returns:
+        str | None: 指定されたステップID（指定なし・複数のステップを指定している場合は None）
+    """
+    steps = {
+        f"STEP_0_CHECK_{int(check)}" if check else f"STEP_{int(step)}"
+        for check, step in _EXPLICIT_STEP_RE.findall(user_question)
+    }
+    return steps.pop() if len(steps) == 1 else None
+
+
+# 各ステップに固有のキーワード（1つのステップだけに該当する場合はLLMを呼ばずに判定する）
+_STEP_KEYWORDS = {
+    "STEP_0_CHECK_1": ("取引条件", "業務内容", "見積チェックリスト"),
+    "STEP_0_CHECK_2": ("労務費データ", "原材料費データ", "エネルギー費", "データ収集"),
+    "STEP_0_CHECK_3": ("原価計算", "製造原価", "原価率"),
+    "STEP_0_CHECK_4": ("単価表",),
+    "STEP_0_CHECK_5": ("見積書", "見積もり書", "見積フォーマット"),
+    "STEP_0_CHECK_6": ("経営方針", "業績動向", "取引先の業績"),
+    "STEP_0_CHECK_7": ("付加価値", "差別化", "自社の強み"),
+    "STEP_0_CHECK_8": ("下請法", "取適法", "取引慣行", "買いたたき", "買い叩き", "優越的地位"),
+    "STEP_0_CHECK_9": ("価格転嫁の必要性", "価格転嫁検討ツール", "利益率の変化"),
+    "STEP_1": ("業界動向", "市場動向", "価格改定の動向"),
+    "STEP_2": ("交渉方針", "交渉戦略"),
+    "STEP_3": ("申し入れ", "申入れ", "申入書", "依頼文"),
+    "STEP_4": ("説明資料", "交渉資料"),
+    "STEP_5": ("発注後", "受注後"),
+}
+
+# 全ステップのキーワードを1つの正規表現にまとめ、該当したステップをグループ名で判別する
+_STEP_KEYWORD_RE = re.compile("|".join(
+    f"(?P<{step}>{'|'.join(map(re.escape, keywords))})"
+    for step, keywords in _STEP_KEYWORDS.items()
+))
+
+
+def _match_step_keyword(user_question: str):
+    """キーワードからステップを判定
+
+    Args:
+        user_question: ユーザーの質問内容
+
+    Returns:
+        tuple | None: 1つのステップだけに該当した場合は (ステップID, 該当キーワード)、
+            該当なし・複数ステップに該当する場合は None
+    """
+    matched = None
+    for m in _STEP_KEYWORD_RE.finditer(user_question):
+        if matched is None:
+            matched = (m.lastgroup, m.group())
+        elif m.lastgroup != matched[0]:
+            return None
+    return matched
+
+
+# 判定を省略できる短い発言の最大文字数
+_CONTINUATION_MAX_LEN = 40
+
+# 話題の切り替えを示す可能性のある語（含まれていれば短い発言でも判定する）
+_TOPIC_HINT_RE = re.compile(r'価格|値上げ|転嫁|交渉|単価|原価|見積|コスト|取引|次の|別の|最初から')
+
+
+def is_step_continuation(user_question: str) -> bool:
+    """現在のステップのまま続けてよい発言かどうか（ステップ判定を省略できるか）
+
+    「はい」「お願いします」のような短い相づちは、ステップ確定後であれば判定しても結果は変わらない。
+    ステップの直接指定・ステップ固有のキーワード・話題の切り替えを示す語を含む場合は対象外。
+
+    Args:
+        user_question: ユーザーの質問内容
+
+    Returns:
+        bool: 判定を省略してよい場合True
+    """
+    question = user_question.strip()
+    return (
+        len(question) < _CONTINUATION_MAX_LEN
+        and not _EXPLICIT_STEP_RE.search(question)
+        and not _STEP_KEYWORD_RE.search(question)
+        and not _TOPIC_HINT_RE.search(question)
+    )
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _classify_step(user_question: str) -> str:
+    """LLMでステップを判定（同じ質問の結果はキャッシュする）
+
+    判定プロンプトは質問文のみに依存するため、質問文をキーにキャッシュする。
+    例外はキャッシュされないため、エラー時は次回あらためてLLMを呼び出す。
+
+    Args:
+        user_question: 前後の空白を除いたユーザーの質問内容
+
+    Returns:
+        str: 判定結果（JSON形式）
+
+    Raises:
+        Exception: Bedrock呼び出しまたはレスポンス解析に失敗した場合
+    """
+    global _latency_optimized
+    # ウォームアップ中であれば、接続確立を少しだけ待ってから呼び出す
+    if _warmup_started and not _warmup_done.is_set():
+        _warmup_done.wait(0.2)
+
+    # LLMを使ってステップを判定（クライアントはプロセス内で共有）
+    bedrock_runtime = _get_client()
+
+    # ステップ判定用のプロンプト（判定基準はシステムプロンプト側に固定）
+    prompt = _PROMPT_HEAD + user_question
+    messages = [{"role": "user", "content": [{"text": prompt}]}]
+
+    logger.debug("ステップ判定のBedrock APIを呼び出し中（プロンプト長: %d 文字）", len(prompt))
+    # Bedrock APIを呼び出し（Claude Haiku）- リトライロジック付き
+    max_retries = 5
+    retry_delay = 2  # 初期待機時間（秒）
+    
+    response = None
+    last_error = None
+    
+    for attempt in range(max_retries):
+        try:
+            request = _REQUEST_LATENCY_OPTIMIZED if _latency_optimized else _REQUEST_STANDARD
+            response = bedrock_runtime.converse(messages=messages, **request)
+            logger.debug("Bedrock API呼び出し成功")
+            break  # 成功したらループを抜ける
+            
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', '')
+            last_error = e
+            
+            error_message = e.response.get('Error', {}).get('Message', '').lower()
+            if (error_code == 'ValidationException' and _latency_optimized
+                    and ('performanceconfig' in error_message or 'latency' in error_message)):
+                # レイテンシ最適化に未対応のモデル・リージョンでは、以降は標準設定で呼び出す
+                # （それ以外の入力エラーは下で再スローする）
+                _latency_optimized = False
+                logger.info("レイテンシ最適化推論に未対応のため、標準設定で再試行します")
+                continue
+            if error_code == 'ThrottlingException':
+                if attempt < max_retries - 1:
+                    wait_time = retry_delay * (2 ** attempt)  # 指数バックオフ
+                    logger.warning("レート制限エラー（試行 %d/%d）: %d秒待機してから再試行します", attempt + 1, max_retries, wait_time)
+                    time.sleep(wait_time)
+                    continue
+                else:
+                    logger.error("ステップ判定のBedrock API呼び出しが最大リトライ回数に達しました")
+                    raise
+            else:
+                # ThrottlingException以外のエラーは即座に再スロー
+                raise
+                
+    if response is None:
+        raise last_error if last_error else Exception("API呼び出しに失敗しました")
+
+    # レスポンスを解析（ツール呼び出しの引数をそのまま判定結果として使う）
+    content = response['output']['message']['content']
+    result = next((block['toolUse']['input'] for block in content if 'toolUse' in block), None)
+
+    if result is None:
+        # ツール呼び出しがない場合はテキスト中のJSONを解析
+        assistant_message = "".join(block.get('text', '') for block in content)
+        logger.debug("ツール呼び出しなし - テキストから解析: %.200s", assistant_message)
+        json_match = _JSON_OBJECT_RE.search(assistant_message)
+        result = orjson.loads(json_match.group() if json_match else assistant_message)
+
+    logger.debug("LLMレスポンス: %s", result)
+
+    # 必須フィールドの確認
+    if "step" not in result:
+        result["step"] = "UNKNOWN"
+        logger.warning("'step' フィールドが見つかりません - UNKNOWNを設定")
+    if "confidence" not in result:
+        result["confidence"] = "low"
+        logger.warning("'confidence' フィールドが見つかりません - lowを設定")
+    if "reasoning" not in result:
+        result["reasoning"] = "判定理由が取得できませんでした"
+        logger.warning("'reasoning' フィールドが見つかりません")
+
+    final_result = orjson.dumps(result).decode()
+    logger.debug("ステップ判定完了: %s", final_result)
+
+    return final_result
 
 
 @tool
@@ -49,174 +406,63 @@ def detect_current_step(user_question: str, conversation_context: str = "") -> s
             "reasoning": "原価計算について質問しているため"
         }
     """
-    print("\n" + "="*80)
-    print("🔍 [detect_current_step] ツールが呼び出されました")
-    print(f"📝 ユーザーの質問: {user_question}")
-    print(f"📚 会話文脈: {conversation_context[:100] if conversation_context else '(なし)'}...")
-    print("="*80 + "\n")
+    return detect_step(user_question, conversation_context)
 
-    try:
-        print("🔧 [STEP 1] Bedrockクライアントを初期化中...")
-        # AWSプロファイルを使用してセッションを作成
-        session = boto3.Session(profile_name='bedrock_use_only')
-
-        # LLMを使ってステップを判定
-        bedrock_runtime = session.client(
-            service_name='bedrock-runtime',
-            region_name='ap-northeast-1'
-        )
-        print("✅ [STEP 1] Bedrockクライアント初期化完了\n")
 
-        # ステップ判定用のプロンプト
-        prompt = f"""以下のユーザーの質問から、最も関連する価格転嫁プロセスのステップを判定してください。
+def detect_step(user_question: str, conversation_context: str = "", current_step: Optional[str] = None) -> str:
+    """ユーザーの質問からステップを判定（detect_current_step の本体。APIの自動判定からも呼び出す）
 
-【ユーザーの質問】
-{user_question}
+    ステップ固有のキーワードだけで判定を済ませるのは、ステップが未確定の場合に限る。
+    確定済みのステップは、話のついでに出たキーワードだけでは切り替えずLLMで判定する。
 
-【判定可能なステップ】
-- STEP_0_CHECK_1: 取引条件・業務内容の確認
-- STEP_0_CHECK_2: 原材料費・労務費データの定期収集
-- STEP_0_CHECK_3: 原価計算の実施
-- STEP_0_CHECK_4: 単価表の作成
-- STEP_0_CHECK_5: 見積書フォーマットの整備
-- STEP_0_CHECK_6: 取引先の経営方針・業績把握
-- STEP_0_CHECK_7: 自社の付加価値の明確化
-- STEP_0_CHECK_8: 適正な取引慣行の確認
-- STEP_0_CHECK_9: 価格転嫁の必要性判定
-- STEP_1: 業界動向の情報収集
-- STEP_2: 取引先情報収集と交渉方針検討
-- STEP_3: 書面での申し入れ
-- STEP_4: 説明資料の準備
-- STEP_5: 発注後に発生する価格交渉
+    Args:
+        user_question: ユーザーの質問内容
+        conversation_context: これまでの会話の文脈（オプション）
+        current_step: セッションで確定済みのステップ（未確定の場合は None）
 
-【判定ルール】
-1. 質問内容から最も関連するステップを1つ選んでください
-2. 複数のステップに関連する場合は、最も重要なものを選んでください
-3. 明確に判定できない一般的な質問の場合は "UNKNOWN" を返してください
+    Returns:
+        str: 判定結果（JSON形式。形式は detect_current_step と同じ）
+    """
+    logger.debug("detect_current_step: 質問=%s, 会話文脈=%.100s, 現在のステップ=%s",
+                 user_question, conversation_context or "(なし)", current_step)
 
-【出力形式】
-以下のJSON形式で出力してください：
-{{
-    "step": "STEP_0_CHECK_3",
-    "confidence": "high",
-    "reasoning": "原価計算について質問しているため"
-}}
+    # 挨拶や空のメッセージはステップに関係しないため、LLMを呼ばずにUNKNOWNを返す
+    question = user_question.strip()
+    if _GREETING_RE.match(question):
+        logger.debug("挨拶・空メッセージのため判定をスキップ（UNKNOWN）")
+        return json.dumps({
+            "step": "UNKNOWN",
+            "confidence": "low",
+            "reasoning": "挨拶または空のメッセージのため判定不要"
+        }, ensure_ascii=False)
 
-confidence は "high", "medium", "low" のいずれかです。
-"""
+    # ステップが直接指定されている場合はそのステップとする
+    explicit_step = _match_explicit_step(question)
+    if explicit_step:
+        logger.debug("質問中のステップ指定から判定: %s", explicit_step)
+        return json.dumps({
+            "step": explicit_step,
+            "confidence": "high",
+            "reasoning": "質問中でステップが直接指定されているため"
+        }, ensure_ascii=False)
 
-        print("🔧 [STEP 2] プロンプトを作成しました")
-        print(f"📄 プロンプト長: {len(prompt)} 文字\n")
-
-        print("🔧 [STEP 3] Bedrock APIを呼び出し中...")
-        # Bedrock APIを呼び出し（Claude Haiku）- リトライロジック付き
-        max_retries = 5
-        retry_delay = 2  # 初期待機時間（秒）
-        
-        response = None
-        last_error = None
-        
-        for attempt in range(max_retries):
-            try:
-                response = bedrock_runtime.invoke_model(
-                    modelId="jp.anthropic.claude-haiku-4-5-20251001-v1:0",
-                    body=json.dumps({
-                        "anthropic_version": "bedrock-2023-05-31",
-                        "max_tokens": 500,
-                        "temperature": 0.3,  # 判定タスクなので低めに設定
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ]
-                    })
-                )
-                print("✅ [STEP 3] Bedrock API呼び出し成功\n")
-                break  # 成功したらループを抜ける
-                
-            except ClientError as e:
-                error_code = e.response.get('Error', {}).get('Code', '')
-                last_error = e
-                
-                if error_code == 'ThrottlingException':
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (2 ** attempt)  # 指数バックオフ
-                        print(f"⚠️  [STEP 3] レート制限エラー (試行 {attempt + 1}/{max_retries})")
-                        print(f"⏳ {wait_time}秒待機してから再試行します...\n")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        print(f"❌ [STEP 3] 最大リトライ回数に達しました\n")
-                        raise
-                else:
-                    # ThrottlingException以外のエラーは即座に再スロー
-                    raise
-                    
-        if response is None:
-            raise last_error if last_error else Exception("API呼び出しに失敗しました")
-
-        # レスポンスを解析
-        print("🔧 [STEP 4] レスポンスを解析中...")
-        response_body = json.loads(response['body'].read())
-        assistant_message = response_body['content'][0]['text']
-
-        print("📩 [LLMレスポンス]")
-        print("-" * 80)
-        print(assistant_message)
-        print("-" * 80 + "\n")
-
-        # JSONブロックを抽出（```json ... ``` の中身を取得）
-        print("🔧 [STEP 5] JSON抽出中...")
-        json_match = re.search(r'```json\s*(.*?)\s*```', assistant_message, re.DOTALL)
-        if json_match:
-            result_json = json_match.group(1)
-            print("✅ コードブロック内のJSONを抽出")
-        else:
-            # コードブロックがない場合は全体をJSONとして解析
-            result_json = assistant_message
-            print("⚠️  コードブロックなし - 全体をJSONとして解析")
-
-        print(f"📄 抽出されたJSON: {result_json[:200]}...\n")
-
-        # JSONをパースして検証
-        print("🔧 [STEP 6] JSONをパース中...")
-        result = json.loads(result_json.strip())
-        print("✅ JSONパース成功\n")
-
-        # 必須フィールドの確認
-        print("🔧 [STEP 7] フィールド検証中...")
-        if "step" not in result:
-            result["step"] = "UNKNOWN"
-            print("⚠️  'step' フィールドが見つかりません - UNKNOWNを設定")
-        if "confidence" not in result:
-            result["confidence"] = "low"
-            print("⚠️  'confidence' フィールドが見つかりません - lowを設定")
-        if "reasoning" not in result:
-            result["reasoning"] = "判定理由が取得できませんでした"
-            print("⚠️  'reasoning' フィールドが見つかりません")
-
-        final_result = json.dumps(result, ensure_ascii=False)
-        print("\n" + "="*80)
-        print("🎉 [判定完了]")
-        print(f"📊 判定結果: {final_result}")
-        print("="*80 + "\n")
-
-        return final_result
+    # ステップが未確定で、ステップ固有のキーワードが1つのステップだけに該当する場合はLLMを呼ばない
+    # （キーワード1つだけが根拠のため、信頼度は medium とする）
+    keyword_match = _match_step_keyword(question) if current_step is None else None
+    if keyword_match:
+        step, keyword = keyword_match
+        logger.debug("キーワード「%s」から判定: %s", keyword, step)
+        return json.dumps({
+            "step": step,
+            "confidence": "medium",
+            "reasoning": f"キーワード「{keyword}」に該当するため"
+        }, ensure_ascii=False)
 
+    try:
+        return _classify_step(question)
     except Exception as e:
         # エラーが発生した場合はUNKNOWNを返す
-        print("\n" + "="*80)
-        print("❌ [エラー発生]")
-        print(f"エラー種類: {type(e).__name__}")
-        print(f"エラーメッセージ: {str(e)}")
-        print("="*80 + "\n")
-
-        import traceback
-        print("📋 [詳細トレースバック]")
-        print("-" * 80)
-        traceback.print_exc()
-        print("-" * 80 + "\n")
+        logger.exception("ステップ判定でエラーが発生しました（UNKNOWNを返します）")
 
         error_result = json.dumps({
             "step": "UNKNOWN",
@@ -224,5 +470,4 @@ confidence は "high", "medium", "low" のいずれかです。
             "reasoning": f"判定エラー: {str(e)}"
         }, ensure_ascii=False)
 
-        print(f"⚠️  エラー時の返却値: {error_result}\n")
         return error_result
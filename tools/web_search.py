@@ -1,10 +1,97 @@
 """Web検索ツール（Tavily API + AI信頼性判定）"""
-import json
-import boto3
+import functools
+import logging
+import orjson
 import time
 import re
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from strands import tool
+from agent._bedrock import get_session
+
+logger = logging.getLogger(__name__)
+
+# ソース種別の日本語表示
+SOURCE_TYPE_JA = {
+    'government': '政府機関',
+    'public_org': '公的機関',
+    'academic': '学術機関',
+    'industry_media': '業界メディア',
+    'news_media': 'ニュースメディア',
+    'data_site': 'データ提供サイト',
+    'industry_group': '業界団体',
+    'company': '企業サイト',
+    'media': 'メディア',
+    'unknown': '不明'
+}
+
+# 判定結果のJSONブロック（```json ... ```）
+_JSON_FENCE_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
+# 信頼性判定（Bedrock呼び出し）を並列実行するスレッドプール（全検索で共有）
+_JUDGE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="trust-judge")
+
+
+# ドメインだけで信頼性を判定できる情報源（ホスト名の末尾, ソース種別, 理由）
+# 該当しないURLのみAIで判定する
+_TRUSTED_DOMAIN_SUFFIXES = (
+    (".go.jp", "government", "日本の政府機関のドメイン（go.jp）"),
+    (".lg.jp", "government", "地方公共団体のドメイン（lg.jp）"),
+    (".ac.jp", "academic", "日本の大学・研究機関のドメイン（ac.jp）"),
+    (".gov", "government", "政府機関のドメイン（gov）"),
+    (".edu", "academic", "教育・研究機関のドメイン（edu）"),
+)
+
+
+def _judge_by_domain(url: str):
+    """ドメインから信頼性を判定（AI判定の前に行う簡易判定）
+
+    Args:
+        url: 判定対象のURL
+
+    Returns:
+        dict | None: 判定できた場合は is_trusted_source_ai と同じ形式の結果、判定できない場合は None
+    """
+    host = "." + (urlsplit(url).hostname or "")
+    for suffix, source_type, reasoning in _TRUSTED_DOMAIN_SUFFIXES:
+        if host.endswith(suffix):
+            return {
+                "is_trusted": True,
+                "reasoning": reasoning,
+                "source_type": source_type,
+            }
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_bedrock_runtime():
+    """信頼性判定用のbedrock-runtimeクライアントを取得
+
+    セッション・クライアントは初回のみ生成し、HTTPS接続プールを使い回す。
+
+    Returns:
+        bedrock-runtimeクライアント
+    """
+    # プロセス内で共有するセッション（エージェントのモデルと共通）から生成
+    return get_session().client(
+        service_name='bedrock-runtime',
+        region_name='ap-northeast-1'
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _get_tavily_client(api_key: str):
+    """Tavilyクライアントを取得（APIキーごとに共有）
+
+    Args:
+        api_key: Tavily APIキー
+
+    Returns:
+        TavilyClient: Tavilyクライアント
+    """
+    from tavily import TavilyClient
+    return TavilyClient(api_key=api_key)
 
 
 def is_trusted_source_ai(url: str, title: str, content: str) -> dict:
@@ -22,17 +109,17 @@ def is_trusted_source_ai(url: str, title: str, content: str) -> dict:
             "source_type": str  # "government", "public_org", "academic", "media", "unknown"
         }
     """
-    try:
-        print(f"\n🔍 [AI信頼性判定] URL: {url}")
+    # 政府機関・大学などのドメインはAIを呼ばずに判定
+    domain_result = _judge_by_domain(url)
+    if domain_result is not None:
+        logger.debug("ドメイン判定: %s: %s", url, domain_result['reasoning'])
+        return domain_result
 
-        # AWSプロファイルを使用してセッションを作成
-        session = boto3.Session(profile_name='bedrock_use_only')
+    try:
+        logger.debug("AI信頼性判定: URL=%s", url)
 
         # LLMを使って信頼性を判定
-        bedrock_runtime = session.client(
-            service_name='bedrock-runtime',
-            region_name='ap-northeast-1'
-        )
+        bedrock_runtime = _get_bedrock_runtime()
 
         prompt = f"""以下のWeb検索結果が、中小企業の価格転嫁に関する情報源として信頼できるかどうかを判定してください。
 
@@ -91,7 +178,7 @@ source_type は以下から選択：
             try:
                 response = bedrock_runtime.invoke_model(
                     modelId="jp.anthropic.claude-haiku-4-5-20251001-v1:0",
-                    body=json.dumps({
+                    body=orjson.dumps({
                         "anthropic_version": "bedrock-2023-05-31",
                         "max_tokens": 300,
                         "temperature": 0.1,  # 判定タスクなので低めに設定
@@ -112,12 +199,11 @@ source_type は以下から選択：
                 if error_code == 'ThrottlingException':
                     if attempt < max_retries - 1:
                         wait_time = retry_delay * (2 ** attempt)  # 指数バックオフ
-                        print(f"⚠️  [AI信頼性判定] レート制限エラー (試行 {attempt + 1}/{max_retries})")
-                        print(f"⏳ {wait_time}秒待機してから再試行します...")
+                        logger.warning("AI信頼性判定のレート制限エラー（試行 %d/%d）: %d秒待機してから再試行します", attempt + 1, max_retries, wait_time)
                         time.sleep(wait_time)
                         continue
                     else:
-                        print(f"❌ [AI信頼性判定] 最大リトライ回数に達しました")
+                        logger.error("AI信頼性判定が最大リトライ回数に達しました")
                         raise
                 else:
                     # ThrottlingException以外のエラーは即座に再スロー
@@ -127,26 +213,30 @@ source_type は以下から選択：
             raise last_error if last_error else Exception("API呼び出しに失敗しました")
 
         # レスポンスを解析
-        response_body = json.loads(response['body'].read())
+        response_body = orjson.loads(response['body'].read())
         assistant_message = response_body['content'][0]['text']
 
         # JSONブロックを抽出
-        json_match = re.search(r'```json\s*(.*?)\s*```', assistant_message, re.DOTALL)
+        json_match = _JSON_FENCE_RE.search(assistant_message)
         if json_match:
             result_json = json_match.group(1)
         else:
             result_json = assistant_message
 
-        result = json.loads(result_json.strip())
+        result = orjson.loads(result_json.strip())
+        missing = [key for key in ("is_trusted", "reasoning", "source_type") if key not in result]
+        if missing:
+            raise ValueError(f"判定結果に必要な項目がありません: {', '.join(missing)}")
 
-        print(f"✅ 判定結果: {'信頼できる' if result.get('is_trusted') else '信頼できない'}")
-        print(f"   理由: {result.get('reasoning', '不明')}")
-        print(f"   種類: {result.get('source_type', 'unknown')}\n")
+        logger.debug(
+            "判定結果: %s: 信頼できる=%s, 理由=%s, 種類=%s",
+            url, result.get('is_trusted'), result.get('reasoning', '不明'), result.get('source_type', 'unknown'),
+        )
 
         return result
 
     except Exception as e:
-        print(f"❌ [AI信頼性判定エラー] {str(e)}")
+        logger.warning("AI信頼性判定エラー: %s: %s", url, e)
         # エラー時は安全側（信頼できない）に倒す
         return {
             "is_trusted": False,
@@ -168,54 +258,68 @@ def web_search(query: str, max_results: int = 5) -> str:
     """
     try:
         import os
-        from tavily import TavilyClient
 
-        print(f"\n{'='*80}")
-        print(f"🔍 [Web検索] 検索クエリ: {query}")
-        print(f"{'='*80}\n")
+        logger.debug("Web検索: 検索クエリ=%s", query)
 
         # 環境変数からAPIキーを取得（デプロイ時に設定）
         api_key = os.environ.get("TAVILY_API_KEY", "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")
-        tavily_client = TavilyClient(api_key=api_key)
+        tavily_client = _get_tavily_client(api_key)
 
         # より多めに検索して、フィルタリング後に十分な結果を確保
-        print(f"🌐 Tavily APIで検索中...")
         response = tavily_client.search(
             query=query,
             max_results=max_results * 2,  # AI判定するため多めに取得
             search_depth="advanced",
             include_answer=True,
         )
-        print(f"✅ {len(response.get('results', []))}件の検索結果を取得\n")
+        logger.debug("%d件の検索結果を取得", len(response.get('results', [])))
 
         # AIを使って各結果の信頼性を判定
         filtered_results = []
         trusted_count = 0
         untrusted_count = 0
 
-        print(f"🔍 フィルタリング中...")
+        # 同じURLの結果は最初の1件だけを判定する（重複分のAI判定を省く）
+        seen_urls = set()
+        unique_results = []
         for result in response.get("results", []):
             url = result.get('url', '')
-            title = result.get('title', '')
-            content = result.get('content', '')
-
-            # AI判定を実行
-            trust_result = is_trusted_source_ai(url, title, content)
-
-            if trust_result.get("is_trusted"):
-                # 信頼性情報を結果に追加
-                result['trust_info'] = trust_result
-                filtered_results.append(result)
-                trusted_count += 1
-
-                if len(filtered_results) >= max_results:
-                    break
-            else:
-                untrusted_count += 1
-                print(f"⚠️  除外: {url}")
-                print(f"   理由: {trust_result.get('reasoning', '不明')}\n")
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            unique_results.append(result)
+
+        # AI判定を全件まとめて並列実行し、結果は検索順に評価する
+        judgements = [
+            (result, _JUDGE_EXECUTOR.submit(
+                is_trusted_source_ai,
+                result.get('url', ''),
+                result.get('title', ''),
+                result.get('content', ''),
+            ))
+            for result in unique_results
+        ]
+        try:
+            for result, future in judgements:
+                trust_result = future.result()
+
+                if trust_result.get("is_trusted"):
+                    # 信頼性情報を結果に追加
+                    result['trust_info'] = trust_result
+                    filtered_results.append(result)
+                    trusted_count += 1
+
+                    if len(filtered_results) >= max_results:
+                        break
+                else:
+                    untrusted_count += 1
+                    logger.debug("除外: %s（理由: %s）", result.get('url', ''), trust_result.get('reasoning', '不明'))
+        finally:
+            # 必要件数が揃った時点で、まだ開始していない判定は取り消す
+            for _, future in judgements:
+                future.cancel()
 
-        print(f"\n📊 フィルタリング結果: 信頼できる {trusted_count}件 / 除外 {untrusted_count}件\n")
+        logger.debug("フィルタリング結果: 信頼できる %d件 / 除外 %d件", trusted_count, untrusted_count)
 
         # 結果テキストを構築
         result_text = f"【検索クエリ】: {query}\n\n"
@@ -236,18 +340,7 @@ def web_search(query: str, max_results: int = 5) -> str:
             source_type = trust_info.get('source_type', 'unknown')
 
             # ソース種別の日本語表示
-            source_type_ja = {
-                'government': '政府機関',
-                'public_org': '公的機関',
-                'academic': '学術機関',
-                'industry_media': '業界メディア',
-                'news_media': 'ニュースメディア',
-                'data_site': 'データ提供サイト',
-                'industry_group': '業界団体',
-                'company': '企業サイト',
-                'media': 'メディア',
-                'unknown': '不明'
-            }.get(source_type, '不明')
+            source_type_ja = SOURCE_TYPE_JA.get(source_type, '不明')
 
             result_text += f"\n{i}. {result['title']}\n"
             result_text += f"   URL: {result['url']}\n"
@@ -258,5 +351,5 @@ def web_search(query: str, max_results: int = 5) -> str:
 
         return result_text
     except Exception as e:
-        print(f"❌ [Web検索エラー] {str(e)}")
+        logger.error("Web検索エラー: %s", e)
         return f"検索エラー: {str(e)}"
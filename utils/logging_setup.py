@@ -0,0 +1,37 @@
+"""ログ出力の設定"""
+import atexit
+import logging
+import logging.handlers
+import queue
+
+_LOG_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+# 起動済みのリスナー（多重設定を防ぐ）
+_listener = None
+
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """キュー経由の非同期ログ出力を設定
+
+    ログの書き込み（ストリームへのI/O）はバックグラウンドスレッドで行い、
+    ログを出したスレッド（リクエスト処理やイベントループ）をブロックしない。
+
+    Args:
+        level: ルートロガーのログレベル
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # 終了時にキューに残ったログを書き出す
+    atexit.register(_listener.stop)
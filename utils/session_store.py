@@ -0,0 +1,94 @@
+"""セッションストア（件数上限・有効期限付きLRU）"""
+import collections
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# get() でセッションがないことを表す目印
+_MISSING = object()
+
+
+class SessionStore:
+    """件数上限・有効期限付きのセッションストア
+
+    上限を超えた場合は最も長く参照されていないセッションから破棄する。
+    また、最後の参照から ttl 秒を超えたセッションは期限切れとして扱い、存在しないものとみなす。
+    セッションはエージェントと会話履歴を保持するため、上限なしではメモリ使用量が増え続ける。
+    期限切れのセッションを返さないよう、操作は下記のメソッド（in / [] / get / del / len）に限定する。
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None):
+        """セッションストアを初期化
+
+        Args:
+            maxsize: 保持するセッション数の上限
+            ttl: 最後の参照からの有効期限（秒）。None の場合は期限なし
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # セッションID -> (最終参照時刻（time.monotonic）, セッション)。参照の古い順に並べる
+        self._data: collections.OrderedDict = collections.OrderedDict()
+
+    def _expired(self, accessed: float, now: float) -> bool:
+        """最終参照時刻が期限切れかどうか"""
+        return self.ttl is not None and now - accessed > self.ttl
+
+    def _evict_expired(self):
+        """期限切れのセッションを破棄（参照順に並んでいるため、先頭から期限内のものが出るまで）"""
+        now = time.monotonic()
+        while self._data:
+            session_id, (accessed, _) = next(iter(self._data.items()))
+            if not self._expired(accessed, now):
+                break
+            del self._data[session_id]
+            logger.info("有効期限切れのセッションを破棄: session_id=%s", session_id)
+
+    def get(self, session_id: str, default=None):
+        """セッションを取得（存在しない・期限切れの場合は default）
+
+        取得したセッションは最終参照時刻を更新し、最も新しく参照されたものとして扱う。
+
+        Args:
+            session_id: セッションID
+            default: セッションがない場合に返す値
+
+        Returns:
+            dict: セッション
+        """
+        entry = self._data.get(session_id)
+        if entry is None:
+            return default
+        now = time.monotonic()
+        if self._expired(entry[0], now):
+            del self._data[session_id]
+            logger.info("有効期限切れのセッションを破棄: session_id=%s", session_id)
+            return default
+        self._data[session_id] = (now, entry[1])
+        self._data.move_to_end(session_id)
+        return entry[1]
+
+    def __contains__(self, session_id) -> bool:
+        return self.get(session_id, _MISSING) is not _MISSING
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id, _MISSING)
+        if session is _MISSING:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id, session):
+        self._data[session_id] = (time.monotonic(), session)
+        self._data.move_to_end(session_id)
+        self._evict_expired()
+        while len(self._data) > self.maxsize:
+            evicted_id, _ = self._data.popitem(last=False)
+            logger.info("セッション数が上限（%d）を超えたため破棄: session_id=%s", self.maxsize, evicted_id)
+
+    def __delitem__(self, session_id):
+        del self._data[session_id]
+
+    def __len__(self) -> int:
+        self._evict_expired()
+        return len(self._data)
@@ -0,0 +1,47 @@
+"""ステップ判定の同時リクエストの集約"""
+import asyncio
+from typing import Callable, Dict, Optional, Tuple
+
+
+class StepDetectionBatcher:
+    """同じ質問に対するステップ判定を1回の呼び出しにまとめる
+
+    判定中の質問と同じ質問が届いた場合は、新たに判定せず実行中の結果を共有する。
+    最初のリクエストは待たずにすぐ判定を開始するため、単独のリクエストに遅延は加わらない。
+    """
+
+    def __init__(self, detect: Callable[[str, str], str]):
+        """初期化
+
+        Args:
+            detect: ステップ判定関数（同期関数。引数は質問・会話文脈・確定済みのステップ、戻り値はJSON文字列）
+        """
+        self._detect = detect
+        self._in_flight: Dict[Tuple[str, Optional[str]], asyncio.Future] = {}
+
+    async def detect(self, user_question: str, conversation_context: str = "",
+                     current_step: Optional[str] = None) -> str:
+        """ステップを判定
+
+        判定結果は質問内容と確定済みのステップで決まるため、前後の空白を除いた質問と
+        確定済みのステップの組をキーに集約する。
+
+        Args:
+            user_question: ユーザーの質問内容
+            conversation_context: これまでの会話の文脈
+            current_step: セッションで確定済みのステップ（未確定の場合は None）
+
+        Returns:
+            str: 判定結果（JSON形式）
+        """
+        key = (user_question.strip(), current_step)
+        future = self._in_flight.get(key)
+        if future is None:
+            # 同期関数を既定のスレッドプールで実行（イベントループをブロックしない）
+            future = asyncio.ensure_future(
+                asyncio.to_thread(self._detect, user_question, conversation_context, current_step)
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # 1つのリクエストがキャンセルされても、共有している判定は継続させる
+        return await asyncio.shield(future)
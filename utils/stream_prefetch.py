@@ -0,0 +1,148 @@
+"""イベントストリームの先読み"""
+import asyncio
+from typing import AsyncIterator, Optional
+
+# 先読み終了の目印
+_END = object()
+
+
+class StreamPrefetcher:
+    """非同期イベントストリームをバックグラウンドタスクで先読みする
+
+    生成と同時にストリームの読み出しを開始し、イベントをキューに溜める。
+    ストリームの読み出しから後始末までを1つのタスク内で行うため、
+    Strandsがストリーム中に設定するトレースのコンテキストもタスクをまたがない。
+    利用側は events() で溜まったイベントから順に受け取り、不要になれば cancel() / aclose() で破棄する。
+    """
+
+    def __init__(self, stream: AsyncIterator[dict], hold_tools: bool = False):
+        """先読みを開始
+
+        Args:
+            stream: 先読みするイベントストリーム
+            hold_tools: True の場合、ツール使用のイベントが来た時点で release() まで読み出しを止める
+                （ツールは読み出しを進めたときに実行されるため、破棄するかもしれない先読みでツールを実行しない）
+        """
+        self._stream = stream
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._error: Optional[BaseException] = None
+        self._released = asyncio.Event()
+        if not hold_tools:
+            self._released.set()
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        """ストリームを最後まで読み出してキューに積む"""
+        try:
+            async for event in self._stream:
+                self._queue.put_nowait(event)
+                if "current_tool_use" in event and not self._released.is_set():
+                    await self._released.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._queue.put_nowait(_END)
+            # 途中で中断された場合も、ストリームの後始末は読み出しと同じタスクで行う
+            aclose = getattr(self._stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    @property
+    def failed(self) -> bool:
+        """先読み中にストリームがエラーで終了したかどうか"""
+        return self._task.done() and self._error is not None
+
+    async def events(self, max_chars: int = 8192, max_ms: float = 25,
+                     keepalive: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """先読みしたイベントから順に返す
+
+        "data" イベント（テキスト差分）を最大 max_chars 文字、または max_ms ミリ秒ごとに
+        1つの {"data": str} イベントにまとめて返す。ツール使用などの構造化イベントは、
+        溜めているテキストを先に返したうえで返すため、イベントの順序は変わらない。
+        応答開始までの時間を縮めるため、最初のテキストだけは溜めずにすぐ返す。
+        モデルの生イベント（"event"キー）はテキスト差分ごとに届き、まとめる妨げになるうえ
+        利用側で使わないため返さない。
+        keepalive を指定した場合、その秒数イベントがなければ None を返す（接続維持用）。
+
+        Args:
+            max_chars: まとめるテキストの最大文字数
+            max_ms: テキストを溜めておく最大時間（ミリ秒）
+            keepalive: None を返すまでの待ち時間（秒）。None の場合は返さない
+
+        Yields:
+            dict | None: イベント（まとめたテキストは {"data": str} の形式。待ち時間を超えた場合は None）
+
+        Raises:
+            Exception: ストリームがエラーで終了した場合、そのエラー
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        pending = []
+        pending_chars = 0
+        deadline = 0.0
+        first_text = True
+
+        while True:
+            if pending and (pending_chars >= max_chars or loop.time() >= deadline):
+                yield {"data": "".join(pending)}
+                pending.clear()
+                pending_chars = 0
+
+            if not queue.empty():
+                # 溜まっているイベントは待たずに取り出す
+                event = queue.get_nowait()
+            elif pending:
+                # テキストを溜めている間だけ、フラッシュ期限までで待ちを打ち切る
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    continue
+            elif keepalive is not None:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+            else:
+                event = await queue.get()
+
+            if event is _END:
+                break
+            if "event" in event:
+                continue
+
+            data = event.get("data")
+            if isinstance(data, str):
+                if first_text:
+                    first_text = False
+                    yield event
+                    continue
+                if not pending:
+                    deadline = loop.time() + max_ms / 1000
+                pending.append(data)
+                pending_chars += len(data)
+                continue
+
+            if pending:
+                yield {"data": "".join(pending)}
+                pending.clear()
+                pending_chars = 0
+            yield event
+
+        if pending:
+            yield {"data": "".join(pending)}
+        if self._error is not None:
+            raise self._error
+
+    def release(self):
+        """ツール使用で止めている読み出しを再開（以降は止めない）"""
+        self._released.set()
+
+    def cancel(self):
+        """先読みを中断（待たずに戻る）"""
+        self._task.cancel()
+
+    async def aclose(self):
+        """先読みを中断し、ストリームの後始末が終わるまで待つ"""
+        self._task.cancel()
+        await asyncio.wait((self._task,))
@@ -0,0 +1,133 @@
+"""ストリーミング応答からの内部タグの除去"""
+
+# 除去するタグ（開始文字列, 終了文字列）
+_TAGS = (
+    ("[IMAGE_PATH:", "]"),
+    ("[DIAGRAM_IMAGE]", "[/DIAGRAM_IMAGE]"),
+)
+_MAX_OPENER_LEN = max(len(opener) for opener, _ in _TAGS)
+# 図のブロックのみ
+_DIAGRAM_TAGS = _TAGS[1:]
+
+
+def _strip_complete(text: str, tags: tuple) -> str:
+    """テキスト全体から閉じているタグを除去（閉じていないタグはそのまま残す）"""
+    out = []
+    pos = 0
+    start = text.find("[")
+    while start >= 0:
+        next_start = start + 1
+        for opener, closer in tags:
+            if text.startswith(opener, start):
+                end = text.find(closer, start + len(opener))
+                if end >= 0:
+                    out.append(text[pos:start])
+                    pos = next_start = end + len(closer)
+                break
+        start = text.find("[", next_start)
+    if not out:
+        return text
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def strip_tags(text: str) -> str:
+    """応答全文から [IMAGE_PATH:...] と [DIAGRAM_IMAGE]...[/DIAGRAM_IMAGE] を除去
+
+    区切りが固定文字列のため、正規表現を使わず str.find で走査する。
+
+    Args:
+        text: 応答全文
+
+    Returns:
+        str: タグを除いたテキスト
+    """
+    return _strip_complete(text, _TAGS)
+
+
+def strip_diagram_blocks(text: str) -> str:
+    """応答全文から [DIAGRAM_IMAGE]...[/DIAGRAM_IMAGE] のみを除去（[IMAGE_PATH:...] は残す）
+
+    Args:
+        text: 応答全文
+
+    Returns:
+        str: 図のブロックを除いたテキスト
+    """
+    return _strip_complete(text, _DIAGRAM_TAGS)
+
+
+class TagStripper:
+    """ストリーミング中のテキストから [IMAGE_PATH:...] と [DIAGRAM_IMAGE]...[/DIAGRAM_IMAGE] を逐次除去する
+
+    新しく届いた差分だけを走査し、チャンクをまたいだタグも追跡する。
+    タグの途中かもしれない末尾は確定するまで出力を保留する。
+    """
+
+    def __init__(self):
+        # 未確定のテキスト（タグの開始文字列の途中、または閉じていないタグ）
+        self.buf = ""
+        # 現在開いているタグの終了文字列（タグの外では None）
+        self._close = None
+        # 開いているタグ内で終了文字列の探索を再開する位置（buf の先頭からの相対位置）
+        self._scan = 0
+
+    def feed(self, delta: str) -> str:
+        """テキストの差分を追加
+
+        Args:
+            delta: 新しく届いたテキスト
+
+        Returns:
+            str: タグを除いて表示が確定したテキスト
+        """
+        buf = self.buf + delta
+        out = []
+        pos = 0
+        while pos < len(buf):
+            if self._close is not None:
+                # タグ内：終了文字列まで読み飛ばす
+                end = buf.find(self._close, pos + self._scan)
+                if end < 0:
+                    self._scan = max(self._scan, len(buf) - pos - len(self._close) + 1)
+                    break
+                pos = end + len(self._close)
+                self._close = None
+                continue
+
+            start = buf.find("[", pos)
+            if start < 0:
+                out.append(buf[pos:])
+                pos = len(buf)
+                break
+            out.append(buf[pos:start])
+            pos = start
+            head = buf[start:start + _MAX_OPENER_LEN]
+            for opener, closer in _TAGS:
+                if head.startswith(opener):
+                    self._close = closer
+                    self._scan = len(opener)
+                    break
+            else:
+                if any(opener.startswith(head) for opener, _ in _TAGS):
+                    # タグの開始文字列の途中で途切れている：続きが届くまで保留
+                    break
+                out.append("[")
+                pos = start + 1
+
+        self.buf = buf[pos:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        """保留中のテキストを取り出して状態をリセット
+
+        閉じられなかったタグは除去せずにそのまま返す。
+
+        Returns:
+            str: 保留していたテキスト
+        """
+        rest = self.buf
+        self.buf = ""
+        self._close = None
+        self._scan = 0
+        return rest